@@ -1,8 +1,12 @@
 import sys, random, time
 
-from observer import Observer
+from observer import Observer, SharedObserver
 from card import Cards, CardSet
 from log import Log
+from event import PlayEvent
+from belief import JointBelief
+
+ai_log = Log.zone('ai')
 
 class Agent:
     def __init__(self, player, names):
@@ -10,16 +14,23 @@ class Agent:
         self.name = names[player]
         self.observer = Observer(names)
         self.cards = []
+        # Subclasses written against the old keyword interface override
+        # report_play; route events to them in that form.
+        self.legacy_report_play = type(self).report_play is not Agent.report_play
 
     def __str__(self):
         return self.name
 
+    def share_observer(self, table):
+        self.observer = SharedObserver(table, self)
+
     def start_game(self):
         self.observer.start_game()
 
     def start_round(self, card):
         self.observer.start_round(self.player, card)
-        self.cards = [card]
+        self.cards.clear()
+        self.cards.append(card)
 
     def report_draw(self, card):
         self.observer.report_draw(self.player, card)
@@ -31,15 +42,24 @@ class Agent:
     def end_game(self, winner):
         pass
 
+    def report_event(self, event):
+        if self.legacy_report_play:
+            self.report_play(**event.kwargs())
+        else:
+            self._report_event(event)
+
     def report_play(self, *k, **kw):
-        self.observer.report_play(*k, **kw)
-        player = kw['player']
-        card = kw['card']
-        target = kw.get('target', None)
-        discard = kw.get('discard', None)
-        new_card = kw.get('new_card', None)
-        other_card = kw.get('other_card', None)
-        loser = kw.get('loser', None)
+        self._report_event(PlayEvent.from_kwargs(kw))
+
+    def _report_event(self, event):
+        self.observer.report_event(event)
+        player = event.player
+        card = event.card
+        target = event.target
+        discard = event.discard
+        new_card = event.new_card
+        other_card = event.other_card
+        loser = event.loser
 
         if self.player == player:
             self.cards.remove(card)
@@ -61,143 +81,184 @@ class Agent:
         return None
 
 class LowballAgent(Agent):
-    def __init__(self, player, names):
+    # Tunable heuristics; the defaults are the original hand-written choices.
+    # guard_certainty and baron_certainty: hide behind a held HANDMAIDEN when
+    # the best target is less certain than this. target_order: 'certainty'
+    # ranks targets by certainty with score as tiebreak, 'score' the reverse.
+    # discard: 'lowest' or 'highest' card played when no rule forces a card.
+    # exact_beliefs: read opponents' hands and the deck from the joint
+    # posterior instead of each player's independent CardSet.
+    PARAMS = {
+        'guard_certainty': 1.0,
+        'baron_certainty': 1.0,
+        'priest_handmaiden': True,
+        'target_order': 'certainty',
+        'discard': 'lowest',
+        'exact_beliefs': False
+        }
+
+    def __init__(self, player, names, params=None):
         super(LowballAgent, self).__init__(player, names)
+        for name in params or ():
+            if name not in self.PARAMS:
+                raise ValueError('Unknown %s parameter %s' % (type(self).__name__, name))
+        for (name, value) in dict(self.PARAMS, **(params or {})).items():
+            setattr(self, name, value)
+        self.joint = None
+
+    def _joint(self):
+        if self.joint is None:
+            self.joint = JointBelief.from_observer(self.observer, self.player, self.cards)
+        return self.joint
+
+    def _cards(self, player):
+        if self.exact_beliefs and not player.out and player.number != self.player:
+            return self._joint().hands[player.number]
+        return player.cards
+
+    def _deck(self):
+        if self.exact_beliefs:
+            return self._joint().deck
+        return self.observer.deck_set
 
     def start_round(self, card):
         super(LowballAgent, self).start_round(card)
-        Log.print('ai: %s starts with card %s' % (self.name, Cards.name(card)))
+        self.joint = None
+        if ai_log.enabled:
+            ai_log.print('%s starts with card %s', self.name, Cards.name(card))
 
     def report_draw(self, card):
         super(LowballAgent, self).report_draw(card)
-        Log.print('ai: %s draws card %s' % (self.name, Cards.name(card)))
+        self.joint = None
+        if ai_log.enabled:
+            ai_log.print('%s draws card %s', self.name, Cards.name(card))
 
-    def report_play(self, *k, **kw):
-        super(LowballAgent, self).report_play(*k, **kw)
-        card = kw['card']
-        player = kw['player']
-        target = kw.get('target', None)
+    def report_event(self, event):
+        super(LowballAgent, self).report_event(event)
+        self.joint = None
+        if not ai_log.enabled:
+            return
+
+        card = event.card
+        player = event.player
+        target = event.target
 
         if target and not self.observer.players[target].handmaiden:
             if player == self.player:
                 if card == Cards.PRIEST:
-                    Log.print('ai: %s has card %s' % (self.observer.players[target], Cards.name(kw['other_card'])))
+                    ai_log.print('%s has card %s', self.observer.players[target], Cards.name(event.other_card))
                 elif card == Cards.KING:
-                    Log.print('ai: %s now has card %s' % (self.name, Cards.name(kw['other_card'])))
+                    ai_log.print('%s now has card %s', self.name, Cards.name(event.other_card))
             elif target == self.player:
-                if card == Cards.BARON and kw.get('loser', None) == self.player:
-                    Log.print('ai: Winning card was %s' % Cards.name(kw['other_card']))
-                elif card == Cards.PRINCE and kw['discard'] != Cards.PRINCESS:
-                    Log.print('ai: %s draws card %s' % (self.name, Cards.name(kw['new_card'])))
+                if card == Cards.BARON and event.loser == self.player:
+                    ai_log.print('Winning card was %s', Cards.name(event.other_card))
+                elif card == Cards.PRINCE and event.discard != Cards.PRINCESS:
+                    ai_log.print('%s draws card %s', self.name, Cards.name(event.new_card))
                 elif card == Cards.KING:
-                    Log.print('ai: %s now has card %s' % (self.name, Cards.name(kw['other_card'])))
+                    ai_log.print('%s now has card %s', self.name, Cards.name(event.other_card))
+
+    def _rank(self, lst, key, reverse):
+        # Shuffle so remaining ties break randomly, then sort stably from the
+        # least to the most significant key
+        random.shuffle(lst)
+        if self.target_order == 'score':
+            lst.sort(key=key, reverse=reverse)
+            lst.sort(key=lambda x: x[0].score, reverse=True)
+        else:
+            lst.sort(key=lambda x: x[0].score, reverse=True)
+            lst.sort(key=key, reverse=reverse)
+        lst.sort(key=lambda x: x[0].handmaiden)
+        return lst[0]
 
     def _most_likely(self, exclude_card=None):
         lst = []
         for player in self.observer.players:
             if player.number != self.player and not player.out:
-                (card, certainty) = player.cards.most_likely(exclude_card)
+                (card, certainty) = self._cards(player).most_likely(exclude_card)
                 lst.append((player, card, certainty))
 
-        random.shuffle(lst)
-        lst = sorted(lst, key=lambda x: x[0].score, reverse=True)
-        lst = sorted(lst, key=lambda x: x[2], reverse=True)
-        lst = sorted(lst, key=lambda x: x[0].handmaiden)
-
-        Log.print('ai: Hand probabilities:')
-        for l in lst:
-            Log.print('ai:   %s: %s (%i%% chance) %s' % (l[0].name, Cards.name(l[1]), l[2] * 100, '(HANDMAIDEN)' if l[0].handmaiden else ''))
-
-        winner = lst[0]
-        Log.print('ai: %s has most certain hand (%i%% chance of card %s)' % (winner[0].name, winner[2] * 100, Cards.name(winner[1])))
+        winner = self._rank(lst, lambda x: x[2], True)
+        if ai_log.enabled:
+            ai_log.print('Hand probabilities:')
+            for l in lst:
+                ai_log.print('  %s: %s (%i%% chance) %s', l[0].name, Cards.name(l[1]), l[2] * 100, '(HANDMAIDEN)' if l[0].handmaiden else '')
+            ai_log.print('%s has most certain hand (%i%% chance of card %s)', winner[0].name, winner[2] * 100, Cards.name(winner[1]))
         return winner
 
     def _least_likely(self, exclude_card=None):
         lst = []
         for player in self.observer.players:
             if player.number != self.player and not player.out:
-                (card, certainty) = player.cards.most_likely(exclude_card)
+                (card, certainty) = self._cards(player).most_likely(exclude_card)
                 lst.append((player, card, certainty))
 
-        random.shuffle(lst)
-        lst = sorted(lst, key=lambda x: x[0].score, reverse=True)
-        lst = sorted(lst, key=lambda x: x[2])
-        lst = sorted(lst, key=lambda x: x[0].handmaiden)
-
-        Log.print('ai: Hand probabilities:')
-        for l in lst:
-            Log.print('ai:   %s: %s (%i%% chance) %s' % (l[0].name, Cards.name(l[1]), l[2] * 100, '(HANDMAIDEN)' if l[0].handmaiden else ''))
-
-        winner = lst[0]
-        Log.print('ai: %s has least certain hand (%i%% chance of card %s)' % (winner[0].name, winner[2] * 100, Cards.name(winner[1])))
+        winner = self._rank(lst, lambda x: x[2], False)
+        if ai_log.enabled:
+            ai_log.print('Hand probabilities:')
+            for l in lst:
+                ai_log.print('  %s: %s (%i%% chance) %s', l[0].name, Cards.name(l[1]), l[2] * 100, '(HANDMAIDEN)' if l[0].handmaiden else '')
+            ai_log.print('%s has least certain hand (%i%% chance of card %s)', winner[0].name, winner[2] * 100, Cards.name(winner[1]))
         return winner
 
     def _most_likely_less_than(self, card):
         lst = []
         for player in self.observer.players:
             if player.number != self.player and not player.out:
-                certainty = player.cards.chance_less_than(card)
+                certainty = self._cards(player).chance_less_than(card)
                 lst.append((player, certainty))
 
-        random.shuffle(lst)
-        lst = sorted(lst, key=lambda x: x[0].score, reverse=True)
-        lst = sorted(lst, key=lambda x: x[1], reverse=True)
-        lst = sorted(lst, key=lambda x: x[0].handmaiden)
-
-        Log.print('ai: Probabilities that hand is less than %s:' % Cards.name(card))
-        for l in lst:
-            Log.print('ai:   %s: %i%% %s' % (l[0].name, l[1] * 100, '(HANDMAIDEN)' if l[0].handmaiden else ''))
-
-        winner = lst[0]
-        Log.print('ai: %s has best chance (%i%%)' % (winner[0].name, winner[1] * 100))
+        winner = self._rank(lst, lambda x: x[1], True)
+        if ai_log.enabled:
+            ai_log.print('Probabilities that hand is less than %s:', Cards.name(card))
+            for l in lst:
+                ai_log.print('  %s: %i%% %s', l[0].name, l[1] * 100, '(HANDMAIDEN)' if l[0].handmaiden else '')
+            ai_log.print('%s has best chance (%i%%)', winner[0].name, winner[1] * 100)
         return winner
 
     def _highest_expected_value(self):
         lst = []
         for player in self.observer.players:
             if player.number != self.player and not player.out:
-                value = player.cards.expected_value()
+                value = self._cards(player).expected_value()
                 lst.append((player, value))
 
-        random.shuffle(lst)
-        lst = sorted(lst, key=lambda x: x[0].score, reverse=True)
-        lst = sorted(lst, key=lambda x: x[1], reverse=True)
-        lst = sorted(lst, key=lambda x: x[0].handmaiden)
-
-        Log.print('ai: Expected hand values:')
-        for l in lst:
-            Log.print('ai:   %s: %f %s' % (l[0].name, l[1], '(HANDMAIDEN)' if l[0].handmaiden else ''))
-
-        winner = lst[0]
-        Log.print('ai: %s has highest expected hand value %f' % (winner[0].name, winner[1]))
+        winner = self._rank(lst, lambda x: x[1], True)
+        if ai_log.enabled:
+            ai_log.print('Expected hand values:')
+            for l in lst:
+                ai_log.print('  %s: %f %s', l[0].name, l[1], '(HANDMAIDEN)' if l[0].handmaiden else '')
+            ai_log.print('%s has highest expected hand value %f', winner[0].name, winner[1])
         return winner
 
     def get_play(self):
-        Log.print('ai: %s play options: %s %s' % (self.name, Cards.name(self.cards[0]), Cards.name(self.cards[1])))
-        self.observer.print_state('ai', self.player)
+        if ai_log.enabled:
+            ai_log.print('%s play options: %s %s', self.name, Cards.name(self.cards[0]), Cards.name(self.cards[1]))
+            self.observer.print_state(ai_log, self.player)
         ret = self._get_required_play()
         if not ret:
-            cards = sorted(self.cards)
-            card = cards[0]
-            other_card = cards[1]
+            (card, other_card) = self.cards
+            if card > other_card:
+                (card, other_card) = (other_card, card)
+            if self.discard == 'highest' and other_card != Cards.PRINCESS:
+                (card, other_card) = (other_card, card)
 
             ret = {'card': card}
             if card == Cards.GUARD:
                 (player, card, certainty) = self._most_likely(exclude_card=Cards.GUARD)
-                if other_card == Cards.HANDMAIDEN and certainty < 1:
+                if other_card == Cards.HANDMAIDEN and certainty < self.guard_certainty:
                     ret['card'] = Cards.HANDMAIDEN
                 else:
                     ret['target'] = player.number
                     ret['challenge'] = card
             elif card == Cards.PRIEST:
                 (player, card, certainty) = self._least_likely()
-                if other_card == Cards.HANDMAIDEN:
+                if other_card == Cards.HANDMAIDEN and self.priest_handmaiden:
                     ret['card'] = Cards.HANDMAIDEN
                 else:
                     ret['target'] = player.number
             elif card == Cards.BARON:
                 (player, certainty) = self._most_likely_less_than(other_card)
-                if other_card == Cards.HANDMAIDEN and certainty < 1:
+                if other_card == Cards.HANDMAIDEN and certainty < self.baron_certainty:
                     ret['card'] = Cards.HANDMAIDEN
                 else:
                     ret['target'] = player.number
@@ -208,17 +269,21 @@ class LowballAgent(Agent):
         return ret
 
 class EndgameAgent(LowballAgent):
+    # endgame_margin: start endgame play this many cards before the deck is
+    # down to one card per player
+    PARAMS = dict(LowballAgent.PARAMS, endgame_margin=0)
+
     def get_play(self):
-        if self.observer.deck_size <= len(self.observer.players):
+        if self.observer.deck_size <= len(self.observer.players) + self.endgame_margin:
             if Cards.PRINCE in self.cards:
                 other_card = self.cards[0] if self.cards[1] == Cards.PRINCE else self.cards[1]
-                deck_value = self.observer.deck_set.expected_value()
+                deck_value = self._deck().expected_value()
                 if deck_value > other_card and deck_value > Cards.PRINCE:
                     ret = {'card' : Cards.PRINCE, 'target' : self.player }
                     return ret
                 else:
-                    values = [(i, player.cards.expected_value()) for (i, player) in enumerate(self.observer.players)]
-                    values = sorted(values, key=lambda x: x[1], reverse=True)
+                    values = [(i, self._cards(player).expected_value()) for (i, player) in enumerate(self.observer.players)]
+                    values.sort(key=lambda x: x[1], reverse=True)
                     for (i, value) in values:
                         if self.observer.players[i].out or i == self.player:
                             continue
@@ -227,8 +292,8 @@ class EndgameAgent(LowballAgent):
                             return ret
             elif Cards.KING in self.cards:
                 other_card = self.cards[0] if self.cards[1] == Cards.KING else self.cards[1]
-                values = [(i, player.cards.expected_value()) for (i, player) in enumerate(self.observer.players)]
-                values = sorted(values, key=lambda x: x[1], reverse=True)
+                values = [(i, self._cards(player).expected_value()) for (i, player) in enumerate(self.observer.players)]
+                values.sort(key=lambda x: x[1], reverse=True)
                 for (i, value) in values:
                     if self.observer.players[i].out or i == self.player:
                         continue
@@ -238,6 +303,10 @@ class EndgameAgent(LowballAgent):
 
         return super(EndgameAgent, self).get_play()
 
+class ExactAgent(EndgameAgent):
+    # EndgameAgent reading the joint posterior over hidden hands
+    PARAMS = dict(EndgameAgent.PARAMS, exact_beliefs=True)
+
 class ConsoleAgent(Agent):
     def __init__(self, player, names):
         super(ConsoleAgent, self).__init__(player, names)
@@ -263,14 +332,14 @@ class ConsoleAgent(Agent):
         super(ConsoleAgent, self).report_draw(card)
         print('%s draws card %s' % (self.name, Cards.name(card)))
 
-    def report_play(self, *k, **kw):
-        super(ConsoleAgent, self).report_play(*k, **kw)
+    def report_event(self, event):
+        super(ConsoleAgent, self).report_event(event)
 
-        player = kw['player']
-        card = kw['card']
+        player = event.player
+        card = event.card
         self.discarded[card] += 1
-        target = kw.get('target', None)
-        discard = kw.get('discard', None)
+        target = event.target
+        discard = event.discard
 
         if discard:
             self.discarded[discard] += 1
@@ -278,21 +347,21 @@ class ConsoleAgent(Agent):
         if target:
             if not self.observer.players[target].handmaiden:
                 if card == Cards.PRIEST:
-                    other_card = kw.get('other_card', None)
+                    other_card = event.other_card
                     if other_card:
                         print('%s has card %s' % (self.observer.players[target], Cards.name(other_card)))
                 elif card == Cards.BARON:
-                    loser = kw.get('loser', None)
+                    loser = event.loser
                     if loser is not None:
-                        other_card = kw.get('other_card', None)
+                        other_card = event.other_card
                         if other_card:
                             print('Winning card was %s' % Cards.name(other_card))
                 elif card == Cards.PRINCE:
-                    new_card = kw.get('new_card', None)
+                    new_card = event.new_card
                     if new_card:
                         print('%s draws new card %s' % (self.observer.players[target], Cards.name(new_card)))
                 elif card == Cards.KING:
-                    other_card = kw.get('other_card', None)
+                    other_card = event.other_card
                     if other_card:
                         print('%s now has card %s' % (self.observer.players[target], Cards.name(other_card)))
         time.sleep(1)
@@ -300,7 +369,7 @@ class ConsoleAgent(Agent):
     def get_play(self):
         card = None
 
-        self.cards = sorted(self.cards)
+        self.cards.sort()
         play = {}
 
         print()
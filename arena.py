@@ -0,0 +1,249 @@
+import concurrent.futures, math, random
+import multiprocessing
+
+import dealer, agent, ismcts, endgame, book
+from card import Cards, use_variant
+import record
+from profiler import Profiler
+from metrics import Metrics
+import history
+from sandbox import SandboxAgent
+
+AGENT_TYPES = {
+    'random': agent.RandomAgent,
+    'lowball': agent.LowballAgent,
+    'endgame': agent.EndgameAgent,
+    'exact': agent.ExactAgent,
+    'ismcts': ismcts.ISMCTSAgent,
+    'solver': endgame.SolverAgent,
+    'book': book.BookAgent
+    }
+
+NAMES = ['Alice', 'Bob', 'Charlie', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi']
+
+def parse_lineup(spec, extra_types=()):
+    lineup = [s.strip().lower() for s in spec.split(',')]
+    for kind in lineup:
+        if kind not in AGENT_TYPES and kind not in extra_types:
+            raise ValueError('Unknown agent type %s' % kind)
+    variant = Cards.variant
+    if len(lineup) not in range(variant.min_players, variant.max_players + 1):
+        raise ValueError('Lineup must have between %i and %i agents for the %s variant' % (variant.min_players, variant.max_players, variant.name))
+    return lineup
+
+def make_agents(lineup, deadline=None):
+    names = NAMES[:len(lineup)]
+    if deadline is not None:
+        return [SandboxAgent(AGENT_TYPES[kind], i, names, deadline) for (i, kind) in enumerate(lineup)]
+    return [AGENT_TYPES[kind](i, names) for (i, kind) in enumerate(lineup)]
+
+def game_seed(seed, game):
+    return '%i:%i' % (seed, game)
+
+class Arena:
+    def __init__(self, agents, seed=None, shared_observer=False, profiler=None):
+        self.agents = agents
+        self.dealer = dealer.HeadlessDealer(agents, shared_observer)
+        self.seed = seed
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.attach(self.dealer)
+        self.wins = []
+        for agent in self.agents:
+            self.wins.append(0)
+
+    def run_games(self, num_games, first_game=0):
+        for i in range(first_game, first_game + num_games):
+            if self.seed is not None:
+                random.seed(game_seed(self.seed, i))
+            winner = self.dealer.do_game()
+            self.wins[winner] += 1
+
+        if self.profiler is not None:
+            self.profiler.report()
+
+        return self.wins
+
+def _run_chunk(args):
+    (parallel_arena, first_game, num_games) = args
+    return parallel_arena._run_chunk(first_game, num_games)
+
+class ParallelArena:
+    def __init__(self, lineup, seed, workers=None, shared_observer=False, record=None, profile=False, deadline=None, metrics=False,
+            history=None, dataset=None):
+        self.lineup = lineup
+        self.deadline = deadline
+        self.seed = seed
+        self.variant = Cards.variant.name
+        self.shared_observer = shared_observer
+        self.record = record
+        self.history = history
+        self.dataset = dataset
+        self.profiler = Profiler() if profile else None
+        self.metrics = Metrics() if metrics else None
+        self.workers = workers or multiprocessing.cpu_count()
+        self.wins = [0 for kind in lineup]
+        self.penalties = [0 for kind in lineup]
+        self.respawns = [0 for kind in lineup]
+
+    def _run_chunk(self, first_game, num_games):
+        use_variant(self.variant)
+        arena = Arena(make_agents(self.lineup, self.deadline), self.seed, self.shared_observer)
+        recorder = None
+        if self.record:
+            # Each chunk streams to its own shard for the parent to append
+            shard = '%s.%i.part' % (self.record, first_game)
+            recorder = record.Recorder.open_shard(shard, len(self.lineup))
+            arena.dealer.add_listener(recorder)
+        profiler = None
+        if self.profiler is not None:
+            profiler = Profiler()
+            profiler.attach(arena.dealer)
+        metrics = None
+        if self.metrics is not None:
+            metrics = Metrics()
+            metrics.attach(arena.dealer)
+        store = None
+        if self.history:
+            shard = '%s.%i.part' % (self.history, first_game)
+            history.remove_shard(shard)
+            store = history.History(shard, first_game)
+            store.attach(arena.dealer)
+        writer = None
+        if self.dataset:
+            # Imported here so arenas without --dataset do not need NumPy
+            import dataset
+            shard = '%s.%i.part' % (self.dataset, first_game)
+            dataset.remove_shard(shard)
+            writer = dataset.DecisionWriter(shard, len(self.lineup), first_game)
+            writer.attach(arena.dealer)
+
+        try:
+            wins = arena.run_games(num_games, first_game)
+        finally:
+            for agent in arena.agents:
+                if hasattr(agent, 'close'):
+                    agent.close()
+            if recorder:
+                recorder.close()
+            if store:
+                store.close(index=False)
+            if writer:
+                writer.close()
+        return {'wins': wins, 'record': recorder.stream.name if recorder else None, 'stats': profiler.stats if profiler else None,
+            'penalties': arena.dealer.penalties, 'respawns': [getattr(agent, 'respawns', 0) for agent in arena.agents], 'metrics': metrics,
+            'history': store.path if store else None, 'dataset': writer.path if writer else None}
+
+    def _chunks(self, num_games):
+        chunk_size = max(1, num_games // (self.workers * 4))
+        for first_game in range(0, num_games, chunk_size):
+            yield (self, first_game, min(chunk_size, num_games - first_game))
+
+    def run_games(self, num_games):
+        chunks = self._chunks(num_games)
+        if self.workers == 1:
+            self._merge(map(_run_chunk, chunks))
+        else:
+            # Executor workers are not daemonic, so sandboxed agents can
+            # start processes of their own inside them
+            with concurrent.futures.ProcessPoolExecutor(self.workers) as pool:
+                self._merge(pool.map(_run_chunk, chunks))
+
+        if self.profiler is not None:
+            self.profiler.report()
+
+        return self.wins
+
+    def _merge(self, results):
+        recorder = None
+        if self.record:
+            recorder = record.Recorder.open(self.record, len(self.lineup))
+        store = None
+        if self.history:
+            store = history.History(self.history)
+            offset = store.next_game()
+        writer = None
+        if self.dataset:
+            import dataset
+            writer = dataset.DecisionWriter(self.dataset, len(self.lineup))
+            dataset_offset = writer.manifest['games']
+
+        try:
+            for result in results:
+                self._merge_result(result)
+                if result.get('record'):
+                    recorder.merge(result['record'])
+                    record.remove_shard(result['record'])
+                if result.get('history'):
+                    store.merge(result['history'], offset)
+                    history.remove_shard(result['history'])
+                if result.get('dataset'):
+                    writer.merge(result['dataset'], dataset_offset)
+                    dataset.remove_shard(result['dataset'])
+        finally:
+            if recorder:
+                recorder.close()
+            if store:
+                store.close()
+            if writer:
+                writer.close()
+
+    def _merge_result(self, result):
+        for (i, count) in enumerate(result['wins']):
+            self.wins[i] += count
+        if result.get('stats'):
+            self.profiler.merge(result['stats'])
+        if result.get('metrics') is not None:
+            self.metrics.merge(result['metrics'])
+        for (i, count) in enumerate(result.get('penalties', ())):
+            self.penalties[i] += count
+        for (i, count) in enumerate(result.get('respawns', ())):
+            self.respawns[i] += count
+
+class DuplicateArena(ParallelArena):
+    # Every deal set is played once per seat rotation of the lineup, so each
+    # agent sees each seat's cards; wins are scored per deal set and per
+    # lineup slot rather than per seat
+    def __init__(self, lineup, seed, workers=None, shared_observer=False):
+        super(DuplicateArena, self).__init__(lineup, seed, workers, shared_observer)
+        self.squares = [0.0 for kind in lineup]
+        self.deals = 0
+
+    def _run_chunk(self, first_deal, num_deals):
+        use_variant(self.variant)
+        num_players = len(self.lineup)
+        rotations = []
+        for rotation in range(num_players):
+            slots = [(seat + rotation) % num_players for seat in range(num_players)]
+            agents = make_agents([self.lineup[slot] for slot in slots])
+            rotations.append((slots, Arena(agents, shared_observer=self.shared_observer)))
+
+        wins = [0 for kind in self.lineup]
+        squares = [0.0 for kind in self.lineup]
+        for deal in range(first_deal, first_deal + num_deals):
+            deal_wins = [0 for kind in self.lineup]
+            for (rotation, (slots, arena)) in enumerate(rotations):
+                random.seed('%s:%i' % (game_seed(self.seed, deal), rotation))
+                arena.dealer.deck_orders = iter(dealer.DeckSequence(game_seed(self.seed, deal)))
+                winner = arena.dealer.do_game()
+                deal_wins[slots[winner]] += 1
+
+            for (slot, count) in enumerate(deal_wins):
+                wins[slot] += count
+                squares[slot] += (count / num_players) ** 2
+
+        return {'wins': wins, 'squares': squares, 'deals': num_deals}
+
+    def _merge_result(self, result):
+        super(DuplicateArena, self)._merge_result(result)
+        self.deals += result['deals']
+        for (slot, value) in enumerate(result['squares']):
+            self.squares[slot] += value
+
+    def standard_errors(self):
+        ret = []
+        for (slot, total) in enumerate(self.wins):
+            mean = total / len(self.lineup) / self.deals
+            variance = max(self.squares[slot] / self.deals - mean * mean, 0)
+            ret.append(math.sqrt(variance / self.deals))
+        return ret
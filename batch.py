@@ -0,0 +1,350 @@
+import numpy as np
+
+from card import Cards
+
+CARD_VALUES = np.arange(Cards.NUM_CARDS)
+NEEDS_TARGET = np.isin(CARD_VALUES, (Cards.GUARD, Cards.PRIEST, Cards.BARON, Cards.PRINCE, Cards.KING))
+WINNING_SCORE = 4
+
+def _required_countess(held, drawn):
+    countess = (held == Cards.COUNTESS) | (drawn == Cards.COUNTESS)
+    royal = (held == Cards.PRINCE) | (held == Cards.KING) | (drawn == Cards.PRINCE) | (drawn == Cards.KING)
+    return countess & royal
+
+def _fraction(count, total):
+    return np.divide(count, total, out=np.zeros(count.shape), where=total > 0)
+
+class BatchRandomPolicy:
+    def choose(self, sim, g, seat, held, drawn):
+        rng = sim.rng
+        pick_drawn = rng.random(len(g)) < 0.5
+        card = np.where(pick_drawn, drawn, held)
+        other_card = np.where(pick_drawn, held, drawn)
+        card = np.where(card == Cards.PRINCESS, other_card, card)
+        card = np.where(_required_countess(held, drawn), Cards.COUNTESS, card)
+
+        eligible = ~sim.out[g]
+        eligible[:, seat] = card == Cards.PRINCE
+        keys = np.where(eligible, rng.random(eligible.shape), -1)
+        target = np.where(NEEDS_TARGET[card], keys.argmax(axis=1), -1)
+        challenge = rng.integers(Cards.PRIEST, Cards.NUM_CARDS, len(g))
+
+        return (card, target, challenge)
+
+class BatchLowballPolicy:
+    @staticmethod
+    def _most_likely(counts, exclude=None):
+        keys = counts * Cards.NUM_CARDS * 2 + CARD_VALUES
+        card = keys.argmax(axis=-1)
+        if exclude is not None:
+            keys[..., exclude] = -1
+            card = np.where(card == exclude, keys.argmax(axis=-1), card)
+        count = np.take_along_axis(counts, card[..., None], axis=-1)[..., 0]
+        return (card, _fraction(count, counts.sum(axis=-1)))
+
+    @staticmethod
+    def _chance_less_than(counts, card):
+        below = np.cumsum(counts, axis=-1)
+        index = np.broadcast_to((card - 1)[:, None, None], counts.shape[:-1] + (1,))
+        count = np.take_along_axis(below, index, axis=-1)[..., 0]
+        return _fraction(count, counts.sum(axis=-1))
+
+    @staticmethod
+    def _expected_value(counts):
+        return _fraction((counts * CARD_VALUES).sum(axis=-1), counts.sum(axis=-1))
+
+    @staticmethod
+    def _rank(sim, g, seat, value, reverse):
+        order = np.argsort(sim.rng.random(value.shape), axis=1)
+        ineligible = sim.out[g].copy()
+        ineligible[:, seat] = True
+        keys = (-sim.score[g], -value if reverse else value, sim.handmaiden[g], ineligible)
+        for key in keys:
+            key = np.take_along_axis(key, order, axis=1)
+            order = np.take_along_axis(order, np.argsort(key, axis=1, kind='stable'), axis=1)
+        return order[:, 0]
+
+    def choose(self, sim, g, seat, held, drawn):
+        low = np.minimum(held, drawn)
+        high = np.maximum(held, drawn)
+        required = _required_countess(held, drawn)
+        card = np.where(required, Cards.COUNTESS, low)
+        target = np.full(len(g), -1)
+        challenge = np.zeros(len(g), dtype=np.int8)
+        counts = sim.sets[g, seat].astype(np.int64)
+
+        idx = np.flatnonzero(~required & (low == Cards.GUARD))
+        if len(idx):
+            (likely, certainty) = self._most_likely(counts[idx], exclude=Cards.GUARD)
+            t = self._rank(sim, g[idx], seat, certainty, reverse=True)
+            rows = np.arange(len(idx))
+            protect = (high[idx] == Cards.HANDMAIDEN) & (certainty[rows, t] < 1)
+            card[idx] = np.where(protect, Cards.HANDMAIDEN, Cards.GUARD)
+            target[idx] = np.where(protect, -1, t)
+            challenge[idx] = likely[rows, t]
+
+        idx = np.flatnonzero(~required & (low == Cards.PRIEST))
+        if len(idx):
+            (likely, certainty) = self._most_likely(counts[idx])
+            t = self._rank(sim, g[idx], seat, certainty, reverse=False)
+            protect = high[idx] == Cards.HANDMAIDEN
+            card[idx] = np.where(protect, Cards.HANDMAIDEN, Cards.PRIEST)
+            target[idx] = np.where(protect, -1, t)
+
+        idx = np.flatnonzero(~required & (low == Cards.BARON))
+        if len(idx):
+            chance = self._chance_less_than(counts[idx], high[idx])
+            t = self._rank(sim, g[idx], seat, chance, reverse=True)
+            protect = (high[idx] == Cards.HANDMAIDEN) & (chance[np.arange(len(idx)), t] < 1)
+            card[idx] = np.where(protect, Cards.HANDMAIDEN, Cards.BARON)
+            target[idx] = np.where(protect, -1, t)
+
+        idx = np.flatnonzero(~required & ((low == Cards.PRINCE) | (low == Cards.KING)))
+        if len(idx):
+            value = self._expected_value(counts[idx])
+            target[idx] = self._rank(sim, g[idx], seat, value, reverse=True)
+
+        return (card, target, challenge)
+
+POLICY_TYPES = {
+    'random': BatchRandomPolicy,
+    'lowball': BatchLowballPolicy
+    }
+
+class BatchSimulator:
+    def __init__(self, policies, num_games, seed=None):
+        self.policies = policies
+        self.num_players = len(policies)
+        self.num_games = num_games
+        self.rng = np.random.default_rng(seed)
+
+        # The variant's lookup tables are read here rather than at import,
+        # since use_variant rebinds them
+        self.start_counts = np.array(Cards.COUNTS, dtype=np.int8)
+        self.template = np.array(Cards.TEMPLATE, dtype=np.int8)
+        self.deck_size = Cards.DECK_SIZE
+        self.burn = Cards.BURN
+        self.rounds = 0
+        self.ties = 0
+
+        (n, p) = (num_games, self.num_players)
+        self.deck = np.zeros((n, self.deck_size), dtype=np.int8)
+        self.pos = np.zeros(n, dtype=np.int64)
+        self.hand = np.zeros((n, p), dtype=np.int8)
+        self.out = np.zeros((n, p), dtype=bool)
+        self.handmaiden = np.zeros((n, p), dtype=bool)
+        self.score = np.zeros((n, p), dtype=np.int64)
+        self.start = np.zeros(n, dtype=np.int64)
+        self.current = np.zeros(n, dtype=np.int64)
+        self.live = np.ones(n, dtype=bool)
+        self.winner = np.full(n, -1)
+
+        # Vectorized Observer state, indexed by [game, viewer, (player,) card]
+        self.deck_set = np.zeros((n, p, Cards.NUM_CARDS), dtype=np.int8)
+        self.sets = np.zeros((n, p, p, Cards.NUM_CARDS), dtype=np.int8)
+        self.next_card = np.zeros((n, p, Cards.NUM_CARDS), dtype=np.int8)
+
+    def _reveal(self, g, card, viewers):
+        (gi, vi) = np.nonzero(viewers)
+        (gg, c) = (g[gi], card[gi])
+        count = self.deck_set[gg, vi, c]
+        self.deck_set[gg, vi, c] = count - (count > 0)
+        count = self.sets[gg, vi, :, c]
+        self.sets[gg, vi, :, c] = count - (count > 0)
+
+    def _keep_only(self, gg, vi, player, card):
+        count = self.sets[gg, vi, player, card]
+        self.sets[gg, vi, player] = 0
+        self.sets[gg, vi, player, card] = count
+
+    def _start_round(self, g):
+        p = self.num_players
+        burn = self.burn
+        start_counts = self.start_counts
+        order = np.argsort(self.rng.random((len(g), self.deck_size)), axis=1)
+        self.deck[g] = self.template[order]
+        self.hand[g] = self.deck[g, burn:burn + p]
+        self.pos[g] = burn + p
+        self.out[g] = False
+        self.handmaiden[g] = False
+        self.current[g] = self.start[g]
+
+        self.deck_set[g] = start_counts
+        self.sets[g] = start_counts
+        for viewer in range(p):
+            card = self.hand[g, viewer]
+            self.deck_set[g, viewer, card] -= 1
+            for player in range(p):
+                if player != viewer:
+                    self.sets[g, viewer, player, card] -= 1
+            self.sets[g, viewer, viewer] = 0
+            self.sets[g, viewer, viewer, card] = start_counts[card]
+
+    def _end_round(self, g):
+        if not len(g):
+            return
+
+        values = np.where(self.out[g], 0, self.hand[g])
+        top = values.max(axis=1)
+        unique = (values == top[:, None]).sum(axis=1) == 1
+        self.rounds += len(g)
+        self.ties += len(g) - int(unique.sum())
+        g = g[unique]
+        winner = values[unique].argmax(axis=1)
+        self.score[g, winner] += 1
+        self.start[g] = winner
+
+        done = self.score[g, winner] == WINNING_SCORE
+        self.winner[g[done]] = winner[done]
+        self.live[g[done]] = False
+
+    def _skip_out(self, g):
+        for i in range(self.num_players):
+            skip = self.out[g, self.current[g]]
+            if not skip.any():
+                break
+            self.current[g[skip]] = (self.current[g[skip]] + 1) % self.num_players
+
+    def _step(self, g):
+        num = len(g)
+        rows = np.arange(num)
+        viewers = np.arange(self.num_players)
+        p = self.current[g]
+        actor = viewers[None, :] == p[:, None]
+        others = ~actor
+
+        drawn = self.deck[g, self.pos[g]]
+        self.pos[g] += 1
+        count = self.deck_set[g, p, drawn]
+        self.next_card[g, p] = 0
+        self.next_card[g, p, drawn] = count
+        self._reveal(g, drawn, actor)
+
+        held = self.hand[g, p]
+        card = np.zeros(num, dtype=np.int8)
+        target = np.full(num, -1)
+        challenge = np.zeros(num, dtype=np.int8)
+        for seat in range(self.num_players):
+            m = p == seat
+            if m.any():
+                (card[m], target[m], challenge[m]) = self.policies[seat].choose(self, g[m], seat, held[m], drawn[m])
+
+        kept = np.where(card == held, drawn, held)
+        self.hand[g, p] = kept
+        self.handmaiden[g, p] = False
+        has_target = target >= 0
+        t = np.where(has_target, target, p)
+        effective = has_target & ~self.handmaiden[g, t]
+        target_card = self.hand[g, t]
+
+        guard = effective & (card == Cards.GUARD)
+        hit = guard & (target_card == challenge)
+        miss = guard & ~hit
+        priest = effective & (card == Cards.PRIEST)
+        baron = effective & (card == Cards.BARON)
+        baron_loser = np.where(target_card > kept, p, t)
+        baron_winner = np.where(target_card > kept, t, p)
+        baron = baron & (target_card != kept)
+        baron_discard = np.minimum(target_card, kept)
+        baron_winning_card = np.maximum(target_card, kept)
+        prince = effective & (card == Cards.PRINCE)
+        prince_out = prince & (target_card == Cards.PRINCESS)
+        redraw = prince & ~prince_out
+        king = effective & (card == Cards.KING)
+
+        self.out[g[hit], t[hit]] = True
+        self.out[g[baron], baron_loser[baron]] = True
+        self.out[g[prince_out], t[prince_out]] = True
+        new_card = np.zeros(num, dtype=np.int8)
+        new_card[redraw] = self.deck[g[redraw], self.pos[g[redraw]]]
+        self.pos[g[redraw]] += 1
+        self.hand[g[redraw], t[redraw]] = new_card[redraw]
+        self.hand[g[king], p[king]] = target_card[king]
+        self.hand[g[king], t[king]] = kept[king]
+        self.handmaiden[g, p] = card == Cards.HANDMAIDEN
+        self.out[g, p] |= card == Cards.PRINCESS
+
+        # Observer.report_play, for every viewer at once
+        next_card = np.where(others[:, :, None], self.deck_set[g], self.next_card[g])
+        current_set = self.sets[g[:, None], viewers[None, :], p[:, None]]
+        contains = current_set[rows[:, None], viewers[None, :], card[:, None]] > 0
+        self.sets[g[:, None], viewers[None, :], p[:, None]] = np.where(contains[:, :, None], next_card, current_set)
+        self._reveal(g, card, others)
+
+        all_viewers = np.ones((num, self.num_players), dtype=bool)
+        if hit.any():
+            self._reveal(g[hit], challenge[hit], all_viewers[hit])
+            self.sets[g[hit], :, t[hit]] = 0
+        if miss.any():
+            self.sets[g[miss], :, t[miss], challenge[miss]] = 0
+        if priest.any():
+            self._keep_only(g[priest], p[priest], t[priest], target_card[priest])
+        if baron.any():
+            (gb, loser, winner) = (g[baron], baron_loser[baron], baron_winner[baron])
+            self._reveal(gb, baron_discard[baron], all_viewers[baron])
+            self.sets[gb, :, loser] = 0
+            beaten = (CARD_VALUES[None, :] >= Cards.GUARD) & (CARD_VALUES[None, :] <= baron_discard[baron][:, None])
+            winner_sets = self.sets[gb, :, winner]
+            self.sets[gb, :, winner] = np.where(beaten[:, None, :], 0, winner_sets)
+            self._keep_only(gb, loser, winner, baron_winning_card[baron])
+        if prince.any():
+            self._reveal(g[prince], target_card[prince], all_viewers[prince])
+        if redraw.any():
+            (gr, tr) = (g[redraw], t[redraw])
+            self.sets[gr, :, tr] = self.deck_set[gr]
+            self._keep_only(gr, tr, tr, new_card[redraw])
+        if king.any():
+            (gk, pk, tk) = (g[king], p[king], t[king])
+            (player_sets, target_sets) = (self.sets[gk, :, pk].copy(), self.sets[gk, :, tk].copy())
+            self.sets[gk, :, pk] = target_sets
+            self.sets[gk, :, tk] = player_sets
+        countess = card == Cards.COUNTESS
+        if countess.any():
+            self.sets[g[countess], :, p[countess], Cards.GUARD:Cards.PRINCE] = 0
+        princess = card == Cards.PRINCESS
+        if princess.any():
+            self.sets[g[princess], :, p[princess]] = 0
+
+        return (~self.out[g]).sum(axis=1) == 1
+
+    def run(self):
+        games = np.arange(self.num_games)
+        self._start_round(games)
+
+        while True:
+            g = np.flatnonzero(self.live)
+            if not len(g):
+                break
+
+            self._skip_out(g)
+            done = self.deck_size - self.pos[g] <= 1
+            if done.any():
+                self._finish_rounds(g[done])
+            g = g[~done]
+
+            if len(g):
+                over = self._step(g)
+                self._finish_rounds(g[over])
+                g = g[~over]
+                self.current[g] = (self.current[g] + 1) % self.num_players
+
+        return np.bincount(self.winner, minlength=self.num_players)
+
+    def _finish_rounds(self, g):
+        self._end_round(g)
+        g = g[self.live[g]]
+        if len(g):
+            self._start_round(g)
+
+def run_batch(lineup, num_games, seed=None, batch_size=10000, totals=None):
+    # totals, when given, receives the number of rounds played and tied
+    rng = np.random.default_rng(seed)
+    wins = np.zeros(len(lineup), dtype=np.int64)
+    for first_game in range(0, num_games, batch_size):
+        policies = [POLICY_TYPES[kind]() for kind in lineup]
+        sim = BatchSimulator(policies, min(batch_size, num_games - first_game), rng.integers(1 << 63))
+        wins += sim.run()
+        if totals is not None:
+            totals['rounds'] = totals.get('rounds', 0) + sim.rounds
+            totals['ties'] = totals.get('ties', 0) + sim.ties
+    return [int(w) for w in wins]
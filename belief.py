@@ -0,0 +1,159 @@
+from card import Cards, CardSet
+
+class Marginal:
+    # Probability of each card for one hidden card, answering the same
+    # queries agents make of a CardSet
+    __slots__ = ('probs',)
+
+    def __init__(self, probs):
+        self.probs = probs
+
+    def __getitem__(self, key):
+        return self.probs[key]
+
+    def contains(self, card):
+        return self.probs[card] > 0
+
+    def certainty(self, card):
+        return self.probs[card]
+
+    def most_likely(self, exclude):
+        probs = self.probs
+        card = other_card = None
+        prob = other_prob = -1
+        for i in range(Cards.NUM_CARDS - 1, -1, -1):
+            p = probs[i]
+            if p > prob:
+                (other_card, other_prob) = (card, prob)
+                (card, prob) = (i, p)
+            elif p > other_prob:
+                (other_card, other_prob) = (i, p)
+
+        if card == exclude:
+            card = other_card
+
+        return (card, self.certainty(card))
+
+    def chance_less_than(self, card):
+        return sum(self.probs[:card])
+
+    def expected_value(self):
+        return sum(i * p for (i, p) in enumerate(self.probs))
+
+def _support(card_set):
+    mask = 0
+    for card in range(Cards.GUARD, Cards.NUM_CARDS):
+        if card_set[card]:
+            mask |= 1 << card
+    return mask
+
+class JointBelief:
+    # Exact posterior over the hidden hands, which are dealt without
+    # replacement from the one pool of unseen cards, each restricted to the
+    # cards its own CardSet still allows. Deals are counted by a forward and
+    # a backward pass over the packed remaining pool, so marginals cost a few
+    # hundred multiplications for a four player table; results are cached by
+    # pool and supports, which repeat from round to round.
+    cache = {}
+    CACHE_SIZE = 1 << 14
+
+    def __init__(self, pool, hands):
+        # hands holds a CardSet per hidden hand and None for the rest
+        self.pool = pool
+        self.hands = [None for card_set in hands]
+        players = [i for (i, card_set) in enumerate(hands) if card_set is not None]
+        key = (pool.bits, tuple(_support(hands[i]) for i in players))
+
+        result = JointBelief.cache.get(key)
+        if result is None:
+            result = JointBelief._solve(pool.bits, key[1])
+            if len(JointBelief.cache) >= JointBelief.CACHE_SIZE:
+                del JointBelief.cache[next(iter(JointBelief.cache))]
+            JointBelief.cache[key] = result
+
+        self.consistent = result is not None
+        if self.consistent:
+            (hand_probs, deck_probs) = result
+            for (i, probs) in zip(players, hand_probs):
+                self.hands[i] = Marginal(probs)
+            self.deck = Marginal(deck_probs)
+        else:
+            # Observers can hold contradictory sets after unusual plays;
+            # fall back to the independent estimate
+            for i in players:
+                self.hands[i] = hands[i]
+            self.deck = pool
+
+    @staticmethod
+    def _solve(pool_bits, supports):
+        shifts = [card * CardSet.BITS for card in range(Cards.NUM_CARDS)]
+        mask = CardSet.MASK
+        choices = [[card for card in range(Cards.GUARD, Cards.NUM_CARDS) if support >> card & 1] for support in supports]
+
+        # forward[i] maps each pool left after dealing the first i hands to
+        # the number of ways of dealing them
+        forward = [{pool_bits: 1}]
+        for cards in choices:
+            layer = {}
+            for (bits, ways) in forward[-1].items():
+                for card in cards:
+                    count = (bits >> shifts[card]) & mask
+                    if count:
+                        rest = bits - (1 << shifts[card])
+                        layer[rest] = layer.get(rest, 0) + ways * count
+            forward.append(layer)
+
+        # backward[i] maps a pool to the number of ways of dealing hands i on
+        backward = [None for layer in forward]
+        backward[-1] = dict.fromkeys(forward[-1], 1)
+        for i in range(len(choices) - 1, -1, -1):
+            after = backward[i + 1]
+            layer = {}
+            for bits in forward[i]:
+                ways = 0
+                for card in choices[i]:
+                    count = (bits >> shifts[card]) & mask
+                    if count:
+                        ways += count * after.get(bits - (1 << shifts[card]), 0)
+                layer[bits] = ways
+            backward[i] = layer
+
+        total = backward[0][pool_bits]
+        if not total:
+            return None
+
+        hand_probs = []
+        expected = [0.0 for card in range(Cards.NUM_CARDS)]
+        for (i, cards) in enumerate(choices):
+            after = backward[i + 1]
+            counts = [0 for card in range(Cards.NUM_CARDS)]
+            for (bits, ways) in forward[i].items():
+                for card in cards:
+                    count = (bits >> shifts[card]) & mask
+                    if count:
+                        counts[card] += ways * count * after.get(bits - (1 << shifts[card]), 0)
+            probs = [count / total for count in counts]
+            hand_probs.append(probs)
+            for card in cards:
+                expected[card] += probs[card]
+
+        # A card outside the hands: the pool less what the hands are
+        # expected to hold
+        left = sum((pool_bits >> shifts[card]) & mask for card in range(Cards.NUM_CARDS)) - len(choices)
+        deck_probs = [0.0 for card in range(Cards.NUM_CARDS)]
+        if left > 0:
+            for card in range(Cards.GUARD, Cards.NUM_CARDS):
+                deck_probs[card] = max(0.0, ((pool_bits >> shifts[card]) & mask) - expected[card]) / left
+        return (hand_probs, deck_probs)
+
+    @staticmethod
+    def from_observer(observer, player, hand):
+        # Beliefs of player's seat; its own hand and players out of the
+        # round are not hidden. The pool is every card not yet shown to the
+        # table less the hand, so it keeps cards the seat has seen but that
+        # are still held, such as one it passed on with KING.
+        pool = CardSet(observer.public_set)
+        for card in hand:
+            pool.remove(card)
+        hands = [None if p.number == player or p.out else p.cards for p in observer.players]
+        return JointBelief(pool, hands)
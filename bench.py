@@ -0,0 +1,256 @@
+import argparse, json, os, platform, random, subprocess, sys, tempfile, time, timeit
+
+import arena
+from card import Cards, CardSet
+from dealer import Deck
+from observer import Observer
+from state import GameState
+from record import Recorder, Replayer, ObserverSeat
+
+SEED = 1234
+LINEUPS = [
+    'endgame,random,lowball,lowball',
+    'lowball,lowball,lowball,lowball',
+    'random,random,random,random',
+    'endgame,lowball'
+    ]
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def _count_allocations(fn):
+    # Traces every bytecode and sums the growth in live memory blocks between
+    # them, so a temporary freed later in the round still counts. Growth and
+    # release inside a single C call cancel out, which makes this a lower
+    # bound.
+    blocks = sys.getallocatedblocks
+    counts = [0, 0]
+    def trace(frame, event, arg):
+        frame.f_trace_opcodes = True
+        counts[0] += max(0, blocks() - counts[1])
+        counts[1] = blocks()
+        return trace
+
+    counts[1] = blocks()
+    sys.settrace(trace)
+    try:
+        fn()
+    finally:
+        sys.settrace(None)
+    return counts[0]
+
+class Benchmark:
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.results = {}
+
+    def _count(self, n):
+        return max(1, int(n * self.scale))
+
+    def _add(self, name, value, unit, better):
+        self.results[name] = {'value': value, 'unit': unit, 'better': better}
+
+    def bench_games(self):
+        num_games = self._count(300)
+        for spec in LINEUPS:
+            for shared_observer in (False, True):
+                lineup = arena.parse_lineup(spec)
+                games = arena.Arena(arena.make_agents(lineup), SEED, shared_observer)
+                start = time.perf_counter()
+                games.run_games(num_games)
+                elapsed = time.perf_counter() - start
+                name = 'games_per_sec/%s%s' % (spec, '/shared' if shared_observer else '')
+                self._add(name, num_games / elapsed, 'games/s', 'higher')
+
+    def bench_get_play(self):
+        lineup = ['endgame', 'random', 'lowball', 'lowball']
+        agents = arena.make_agents(lineup)
+        samples = {}
+        for agent in agents:
+            times = samples.setdefault(agent.__class__.__name__, [])
+            agent.get_play = self._timed(agent.get_play, times)
+
+        arena.Arena(agents, SEED).run_games(self._count(300))
+        for (name, times) in sorted(samples.items()):
+            for (label, fraction) in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+                self._add('get_play_us/%s/%s' % (name, label), _percentile(times, fraction) * 1e6, 'us', 'lower')
+            self._add('get_play_us/%s/mean' % name, sum(times) / len(times) * 1e6, 'us', 'lower')
+
+    @staticmethod
+    def _timed(fn, times):
+        clock = time.perf_counter
+        def timed(*k, **kw):
+            start = clock()
+            ret = fn(*k, **kw)
+            times.append(clock() - start)
+            return ret
+        return timed
+
+    def bench_observer(self):
+        lineup = ['endgame', 'random', 'lowball', 'lowball']
+        (fd, path) = tempfile.mkstemp(suffix='.llev')
+        os.close(fd)
+        try:
+            games = arena.Arena(arena.make_agents(lineup), SEED)
+            recorder = Recorder.open(path, len(lineup))
+            games.dealer.add_listener(recorder)
+            games.run_games(self._count(200))
+            recorder.close()
+
+            with Replayer(path) as replayer:
+                observers = [Observer(arena.NAMES[:len(lineup)]) for kind in lineup]
+                times = {'report_event': [], 'report_draw': []}
+                for observer in observers:
+                    observer.report_event = self._timed(observer.report_event, times['report_event'])
+                    observer.report_draw = self._timed(observer.report_draw, times['report_draw'])
+                replayer.replay([ObserverSeat(i, observer) for (i, observer) in enumerate(observers)])
+        finally:
+            os.remove(path)
+
+        for (name, samples) in sorted(times.items()):
+            self._add('observer_us/%s/mean' % name, sum(samples) / len(samples) * 1e6, 'us', 'lower')
+            self._add('observer_us/%s/p99' % name, _percentile(samples, 0.99) * 1e6, 'us', 'lower')
+
+    def bench_cardset(self):
+        card_set = CardSet.full()
+        card_set.remove(Cards.GUARD)
+        card_set.remove(Cards.PRINCE)
+        ops = {
+            'copy': lambda: CardSet(card_set),
+            'full': CardSet.full,
+            'remove': lambda: CardSet(card_set).remove(Cards.BARON),
+            'clear': lambda: CardSet(card_set).clear(Cards.KING),
+            'certainty': lambda: card_set.certainty(Cards.PRIEST),
+            'most_likely': lambda: card_set.most_likely(Cards.GUARD),
+            'chance_less_than': lambda: card_set.chance_less_than(Cards.HANDMAIDEN),
+            'expected_value': card_set.expected_value
+            }
+        number = self._count(100000)
+        for (name, op) in sorted(ops.items()):
+            elapsed = min(timeit.repeat(op, number=number, repeat=3))
+            self._add('cardset_ns/%s' % name, elapsed / number * 1e9, 'ns', 'lower')
+
+    def bench_state(self):
+        games = arena.Arena(arena.make_agents(['lowball', 'lowball', 'lowball', 'lowball']), SEED)
+        positions = []
+        apply_play = games.dealer._apply_play
+        def capture(play, player):
+            positions.append((GameState.from_dealer(games.dealer, player), (play['card'], play.get('target'), play.get('challenge'))))
+            return apply_play(play, player)
+        games.dealer._apply_play = capture
+        games.run_games(self._count(20))
+
+        def step_undo():
+            for (state, play) in positions:
+                mark = state.snapshot()
+                state.step(*play)
+                state.undo(mark)
+
+        def copy():
+            for (state, play) in positions:
+                state.copy()
+
+        def playout():
+            for (state, play) in positions:
+                state = state.copy()
+                while not state.done:
+                    state.step(*state.legal_plays()[0])
+
+        for (name, op) in (('step_undo', step_undo), ('copy', copy), ('playout', playout)):
+            elapsed = min(timeit.repeat(op, number=1, repeat=3))
+            self._add('state_ns/%s' % name, elapsed / len(positions) * 1e9, 'ns', 'lower')
+
+    def bench_alloc(self):
+        num_rounds = self._count(100)
+        deck = Deck()
+        observer = Observer(arena.NAMES[:4])
+        def round_reset():
+            for i in range(num_rounds):
+                deck.reset()
+                observer.start_round(0, deck.draw())
+
+        # Untraced warm-up so one-off caches are not charged to the loop
+        round_reset()
+        baseline = _count_allocations(lambda: None)
+        self._add('alloc_blocks/round_reset', (_count_allocations(round_reset) - baseline) / num_rounds, 'blocks', 'lower')
+
+        for spec in ('lowball,lowball,lowball,lowball', 'random,random,random,random'):
+            games = arena.Arena(arena.make_agents(arena.parse_lineup(spec)), SEED)
+            dealer = games.dealer
+            def rounds():
+                for i in range(num_rounds):
+                    dealer.do_round(i % len(dealer.agents))
+
+            dealer._start_game()
+            rounds()
+            self._add('alloc_blocks/round/%s' % spec, (_count_allocations(rounds) - baseline) / num_rounds, 'blocks', 'lower')
+
+    def run(self, names):
+        random.seed(SEED)
+        for name in names:
+            getattr(self, 'bench_%s' % name)()
+        return {'environment': _environment(), 'seed': SEED, 'scale': self.scale, 'results': self.results}
+
+SUITES = ['games', 'get_play', 'observer', 'cardset', 'state', 'alloc']
+
+def compare(report, baseline, threshold):
+    regressions = []
+    for (name, result) in sorted(report['results'].items()):
+        if name not in baseline['results']:
+            continue
+        old = baseline['results'][name]['value']
+        new = result['value']
+        if old == 0:
+            continue
+        change = (new - old) / old
+        if result['better'] == 'lower':
+            change = -change
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-50s %12.3f -> %12.3f %s (%+.1f%%)%s' % (name, old, new, result['unit'], change * 100, flag))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--suite', action='append', choices=SUITES, help='suite to run (default: all)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply iteration counts by this factor')
+    parser.add_argument('--output', metavar='PATH', help='write results as JSON to PATH')
+    parser.add_argument('--compare', metavar='BASELINE', help='compare against a saved JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    report = Benchmark(args.scale).run(args.suite or SUITES)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print('%i regression(s) beyond %i%%' % (len(regressions), args.threshold * 100))
+            sys.exit(1)
+    elif not args.output:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
@@ -0,0 +1,244 @@
+import argparse, mmap, multiprocessing, os, random, struct
+
+from agent import EndgameAgent, ai_log
+from card import Cards, VARIANTS
+from state import GameState
+from ismcts import rollout_action
+
+MAGIC = b'LLOB'
+VERSION = 1
+HEADER = struct.Struct('<4sBB10x')
+ENTRY = struct.Struct('<4B')
+NONE = 0xff
+MAX_PLAYERS = 4
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening.book')
+
+def _index(num_players, turn, low, high):
+    return ((num_players * MAX_PLAYERS + turn) * Cards.NUM_CARDS + low) * Cards.NUM_CARDS + high
+
+NUM_ENTRIES = _index(MAX_PLAYERS + 1, 0, 0, 0)
+
+def situations(players):
+    # Every (players, turn, low card, high card) a first decision can face;
+    # turn is the number of plays made earlier in the round
+    ret = []
+    for num_players in players:
+        for turn in range(num_players):
+            for low in range(Cards.GUARD, Cards.NUM_CARDS):
+                for high in range(low, Cards.NUM_CARDS):
+                    if low != high or Cards.start_count(low) > 1:
+                        ret.append((num_players, turn, low, high))
+    return ret
+
+def _deal(rng, num_players, turn, low, high):
+    # Seat the player under study at turn with the round starting at seat 0,
+    # and arrange the deck so its own draw is the pair when no earlier play
+    # disturbs it
+    cards = []
+    for card in range(Cards.GUARD, Cards.NUM_CARDS):
+        cards.extend([card] * Cards.start_count(card))
+    cards.remove(low)
+    cards.remove(high)
+    rng.shuffle(cards)
+
+    hand = cards[:num_players - 1]
+    hand.insert(turn, low)
+    draws = cards[num_players - 1:]
+    draws.insert(turn, high)
+    deck = draws[:0:-1]
+    return GameState(hand, deck, 0, draws[0])
+
+def _evaluate(args):
+    # Deals where earlier plays knock the pair out of the hand are rejected;
+    # the attempt cap keeps a situation that is rarely reached from stalling
+    # generation
+    (situation, samples, seed, max_attempts) = args
+    (num_players, turn, low, high) = situation
+    rng = random.Random(seed)
+    wins = {}
+    trials = {}
+    accepted = 0
+    for attempt in range(max_attempts):
+        if accepted >= samples:
+            break
+        state = _deal(rng, num_players, turn, low, high)
+        for i in range(turn):
+            if state.done or state.current != i:
+                break
+            state.step(*rollout_action(state, rng)[1:])
+        if state.done or state.current != turn or sorted(state.cards(turn)) != [low, high]:
+            continue
+        accepted += 1
+
+        # Every candidate continues from the same deal; which plays are legal
+        # varies between deals, so each is scored over its own trials
+        plays = [play for play in state.legal_plays() if play[0] != Cards.PRINCESS] or state.legal_plays()
+        for play in plays:
+            mark = state.snapshot()
+            state.step(*play)
+            while not state.done:
+                state.step(*rollout_action(state, rng)[1:])
+            wins[play] = wins.get(play, 0) + (state.winner == turn)
+            trials[play] = trials.get(play, 0) + 1
+            state.undo(mark)
+
+    if not accepted:
+        return (situation, None, 0)
+    # A play legal in only a handful of deals cannot win on a lucky rate
+    candidates = [play for play in wins if trials[play] * 10 >= accepted] or list(wins)
+    best = max(candidates, key=lambda play: wins[play] / trials[play])
+    (card, target, challenge) = best
+    offset = NONE if target is None else (target - turn) % num_players
+    return (situation, (card, offset, NONE if challenge is None else challenge, wins[best] * 100 // trials[best]), accepted)
+
+def generate(path, players=(2, 3, 4), samples=2000, seed=0, workers=1, report=None, attempts=20):
+    entries = bytearray(NUM_ENTRIES * ENTRY.size)
+    jobs = [(situation, samples, '%s:%s' % (seed, situation), samples * attempts) for situation in situations(players)]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            results = list(pool.imap(_evaluate, jobs))
+    else:
+        results = map(_evaluate, jobs)
+
+    for (situation, entry, accepted) in results:
+        if entry is not None:
+            ENTRY.pack_into(entries, _index(*situation) * ENTRY.size, *entry)
+        if report:
+            report(situation, entry, accepted)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, MAX_PLAYERS))
+        f.write(entries)
+
+class Book:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) != HEADER.size + NUM_ENTRIES * ENTRY.size:
+            raise ValueError('%s is not an opening book' % path)
+        (magic, version, max_players) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or max_players != MAX_PLAYERS:
+            raise ValueError('%s is not a version %i opening book' % (path, VERSION))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def lookup(self, num_players, turn, cards):
+        (low, high) = cards
+        if low > high:
+            (low, high) = (high, low)
+        if num_players > MAX_PLAYERS or turn >= num_players:
+            return None
+        (card, offset, challenge, chance) = ENTRY.unpack_from(self.map, HEADER.size + _index(num_players, turn, low, high) * ENTRY.size)
+        if card == 0:
+            return None
+        return (card, None if offset == NONE else offset, None if challenge == NONE else challenge, chance)
+
+class BookAgent(EndgameAgent):
+    # Plays its first decision of each round from the opening book and falls
+    # back to EndgameAgent afterwards, or when no book has been generated
+    path = DEFAULT_PATH
+    books = {}
+
+    @staticmethod
+    def book(path):
+        if path not in BookAgent.books:
+            BookAgent.books[path] = Book(path) if os.path.exists(path) else None
+        return BookAgent.books[path]
+
+    def start_round(self, card):
+        super(BookAgent, self).start_round(card)
+        self.first = True
+        self.turn = 0
+        self.targeted = False
+
+    def report_event(self, event):
+        super(BookAgent, self).report_event(event)
+        if self.first:
+            self.turn += 1
+            if event.target == self.player:
+                self.targeted = True
+
+    def _uninformed(self):
+        # Entries average over the earlier plays, so they only stand in while
+        # those plays told nobody more than the cards played: no play aimed at
+        # this player, and every opponent still in could hold any unseen card
+        if self.targeted:
+            return False
+        deck_set = self.observer.deck_set
+        for (i, player) in enumerate(self.observer.players):
+            if i != self.player and not player.out and player.cards.bits != deck_set.bits:
+                return False
+        return True
+
+    def _book_play(self):
+        # Books are generated for the classic deck only
+        book = BookAgent.book(self.path)
+        if book is None or Cards.variant is not VARIANTS['classic'] or not self._uninformed():
+            return None
+        num_players = len(self.observer.players)
+        entry = book.lookup(num_players, self.turn, self.cards)
+        if entry is None:
+            return None
+
+        (card, offset, challenge, chance) = entry
+        ret = {'card': card}
+        if offset is not None:
+            target = (self.player + offset) % num_players
+            player = self.observer.players[target]
+            if player.out or (target != self.player and player.handmaiden):
+                return None
+            ret['target'] = target
+        if challenge is not None:
+            ret['challenge'] = challenge
+        if ai_log.enabled:
+            ai_log.print('%s plays %s from the opening book (%i%% round wins)', self.name, Cards.name(card), chance)
+        return ret
+
+    def get_play(self):
+        first = self.first
+        self.first = False
+        ret = None
+        if first and not self._get_required_play():
+            ret = self._book_play()
+        return ret or super(BookAgent, self).get_play()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', default=DEFAULT_PATH, help='book file to write')
+    parser.add_argument('--players', default='2,3,4', help='comma-separated table sizes to cover')
+    parser.add_argument('--samples', type=int, default=2000, help='simulated deals per situation')
+    parser.add_argument('--seed', type=int, default=0, help='master seed')
+    parser.add_argument('--attempts', type=int, default=20, help='give up on a situation after ATTEMPTS times --samples deals')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--verbose', action='store_true', help='print every book entry')
+    args = parser.parse_args()
+
+    players = [int(n) for n in args.players.split(',')]
+    for n in players:
+        if n not in range(2, MAX_PLAYERS + 1):
+            parser.error('Table sizes must be between 2 and %i' % MAX_PLAYERS)
+
+    short = []
+
+    def report(situation, entry, accepted):
+        (num_players, turn, low, high) = situation
+        if accepted < args.samples:
+            short.append((situation, accepted))
+        if not args.verbose:
+            return
+        if entry is None:
+            print('%i players, turn %i, %s+%s: no deals reached' % (num_players, turn, Cards.name(low), Cards.name(high)))
+            return
+        (card, offset, challenge, chance) = entry
+        print('%i players, turn %i, %s+%s: %s%s%s (%i%% of %i deals)' % (num_players, turn, Cards.name(low), Cards.name(high), Cards.name(card),
+            '' if offset == NONE else ' on +%i' % offset, '' if challenge == NONE else ' guessing %s' % Cards.name(challenge), chance, accepted))
+
+    if args.samples < 1 or args.attempts < 1:
+        parser.error('--samples and --attempts must be positive')
+    generate(args.output, players, args.samples, args.seed, args.workers, report, args.attempts)
+    for ((num_players, turn, low, high), accepted) in short:
+        print('%i players, turn %i, %s+%s: only %i of %i deals reached' % (num_players, turn, Cards.name(low), Cards.name(high), accepted, args.samples))
+    print('Wrote %s' % args.output)
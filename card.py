@@ -9,8 +9,6 @@ class Cards:
     PRINCESS = 8
     NUM_CARDS = 9
 
-    DECK_SIZE = 16
-
     names = [
         'NONE',
         'GUARD',
@@ -25,92 +23,172 @@ class Cards:
 
     @staticmethod
     def start_count(card):
-        if card == Cards.GUARD:
-            return 5
-        elif card in range(Cards.PRIEST, Cards.KING):
-            return 2
-        elif card in range(Cards.KING, Cards.NUM_CARDS):
-            return 1
-        else:
-            return 0
+        return Cards.COUNTS[card]
 
     @staticmethod
     def name(card):
          return Cards.names[card]
 
 class CardSet:
+    # Counts are packed one byte per card into a single int, so copies share
+    # the immutable value and only write their own slot when modified.
+    BITS = 8
+    MASK = (1 << BITS) - 1
+
+    __slots__ = ('bits', 'total', 'weighted')
+
     def __init__(self, other=None):
-        if other:
-            self.cards = other.cards[:]
+        if other is not None:
+            self.bits = other.bits
+            self.total = other.total
+            self.weighted = other.weighted
         else:
-            self.cards = []
-            for i in range(Cards.NUM_CARDS):
-                self.cards.append(0)
+            self.bits = 0
+            self.total = 0
+            self.weighted = 0
 
     def __getitem__(self, key):
-        return self.cards[key]
+        return (self.bits >> (key * CardSet.BITS)) & CardSet.MASK
 
     def __setitem__(self, key, val):
-        self.cards[key] = val
+        shift = key * CardSet.BITS
+        delta = val - ((self.bits >> shift) & CardSet.MASK)
+        if delta:
+            self.bits += delta << shift
+            self.total += delta
+            self.weighted += delta * key
 
     def __str__(self):
         ret = ''
         for i in range(Cards.NUM_CARDS):
-            if self.cards[i] > 0:
-                ret += '%s:%s ' % (Cards.name(i), self.cards[i])
+            if self[i] > 0:
+                ret += '%s:%s ' % (Cards.name(i), self[i])
         return ret
 
+    @property
+    def cards(self):
+        return [self[i] for i in range(Cards.NUM_CARDS)]
+
     def contains(self, card):
-        return self.cards[card] > 0
+        return (self.bits >> (card * CardSet.BITS)) & CardSet.MASK > 0
 
-    def clear(self, exclude=None, cards=range(Cards.NUM_CARDS)):
-        for i in cards:
-            if i != exclude:
-                self.cards[i] = 0
+    def clear(self, exclude=None, cards=None):
+        if cards is None:
+            mask = CardSet.ALL
+        else:
+            mask = 0
+            for i in cards:
+                mask |= CardSet.MASK << (i * CardSet.BITS)
+        if exclude is not None:
+            mask &= ~(CardSet.MASK << (exclude * CardSet.BITS))
+
+        removed = self.bits & mask
+        if removed:
+            self.bits ^= removed
+            for i in range(Cards.NUM_CARDS):
+                count = (removed >> (i * CardSet.BITS)) & CardSet.MASK
+                self.total -= count
+                self.weighted -= count * i
 
     def remove(self, card):
-        if self.cards[card] > 0:
-            self.cards[card] -= 1
+        shift = card * CardSet.BITS
+        if (self.bits >> shift) & CardSet.MASK > 0:
+            self.bits -= 1 << shift
+            self.total -= 1
+            self.weighted -= card
 
     def certainty(self, card):
-        try:
-            return self.cards[card] / sum(self.cards)
-        except ZeroDivisionError:
+        if self.total == 0:
             return 0
+        return ((self.bits >> (card * CardSet.BITS)) & CardSet.MASK) / self.total
 
     def most_likely(self, exclude):
-        cards = range(Cards.NUM_CARDS)
-        cards = sorted(cards, reverse=True)
-        cards = sorted(cards, key=lambda x: self.cards[x], reverse=True)
-        card = cards[0]
+        bits = self.bits
+        card = other_card = None
+        count = other_count = -1
+        for i in range(Cards.NUM_CARDS - 1, -1, -1):
+            n = (bits >> (i * CardSet.BITS)) & CardSet.MASK
+            if n > count:
+                (other_card, other_count) = (card, count)
+                (card, count) = (i, n)
+            elif n > other_count:
+                (other_card, other_count) = (i, n)
+
         if card == exclude:
-            card = cards[1]
+            card = other_card
 
         return (card, self.certainty(card))
 
     def chance_less_than(self, card):
-        try:
-            count = sum(self.cards[c] for c in range(card))
-            return count / sum(self.cards)
-        except ZeroDivisionError:
+        if self.total == 0:
             return 0
+        below = self.bits & ((1 << (card * CardSet.BITS)) - 1)
+        count = ((below * CardSet.ONES) >> ((Cards.NUM_CARDS - 1) * CardSet.BITS)) & CardSet.MASK
+        return count / self.total
 
     def expected_value(self):
-        try:
-            count = sum(c * self.cards[c] for c in range(Cards.NUM_CARDS))
-            return count / sum(self.cards)
-        except ZeroDivisionError:
+        if self.total == 0:
             return 0
+        return self.weighted / self.total
+
+    def reset(self):
+        # In-place CardSet.full() for sets reused across rounds
+        full = CardSet.FULL
+        self.bits = full.bits
+        self.total = full.total
+        self.weighted = full.weighted
 
     @staticmethod
     def full():
-        card_set = CardSet()
-        for card in range(Cards.NUM_CARDS):
-            card_set[card] = Cards.start_count(card)
-        return card_set
+        return CardSet(CardSet.FULL)
 
     @staticmethod
     def single(card):
         card_set = CardSet()
-        card_set[card] = Cards.start_count(card)
+        card_set[card] = Cards.COUNTS[card]
         return card_set
+
+CardSet.ONES = sum(1 << (card * CardSet.BITS) for card in range(Cards.NUM_CARDS))
+CardSet.ALL = CardSet.ONES * CardSet.MASK
+
+class Variant:
+    # A deck and table definition. Everything the hot paths read is compiled
+    # into flat lists and a packed CardSet up front, so switching variants
+    # only rebinds references. burn is the number of cards set aside face
+    # down before the deal, on top of the last card of the deck that is
+    # always held back for a late PRINCE.
+    def __init__(self, name, counts, min_players, max_players, burn=0):
+        if len(counts) != Cards.NUM_CARDS - 1 or min(counts) < 1 or max(counts) > CardSet.MASK:
+            raise ValueError('Variant %s needs a count between 1 and %i for each card' % (name, CardSet.MASK))
+        self.name = name
+        self.counts = [0] + list(counts)
+        self.deck_size = sum(counts)
+        self.min_players = min_players
+        self.max_players = max_players
+        self.burn = burn
+        if self.deck_size < max_players + burn + 2:
+            raise ValueError('Variant %s has too few cards for %i players' % (name, max_players))
+
+        self.template = [card for card in range(Cards.GUARD, Cards.NUM_CARDS) for i in range(self.counts[card])]
+        self.full = CardSet()
+        for card in range(Cards.GUARD, Cards.NUM_CARDS):
+            self.full[card] = self.counts[card]
+
+VARIANTS = {
+    'classic': Variant('classic', (5, 2, 2, 2, 2, 1, 1, 1), 2, 4),
+    'burn': Variant('burn', (5, 2, 2, 2, 2, 1, 1, 1), 2, 4, burn=1),
+    'lean': Variant('lean', (4, 2, 2, 1, 2, 1, 1, 1), 2, 4),
+    # Stand-in for the 5-8 player edition using classic cards only
+    'expansion': Variant('expansion', (10, 4, 4, 4, 4, 2, 2, 2), 5, 8, burn=1)
+    }
+
+def use_variant(name):
+    variant = VARIANTS[name]
+    Cards.variant = variant
+    Cards.COUNTS = variant.counts
+    Cards.DECK_SIZE = variant.deck_size
+    Cards.BURN = variant.burn
+    Cards.TEMPLATE = variant.template
+    CardSet.FULL = variant.full
+
+use_variant('classic')
@@ -0,0 +1,78 @@
+import argparse, math, sys
+
+import arena, batch
+from card import VARIANTS, use_variant
+
+LINEUPS = [
+    'random,lowball',
+    'random,lowball,lowball,lowball',
+    'lowball,random,lowball,random,lowball'
+    ]
+
+def _z_score(a, n, b, m):
+    # Two-proportion z test with the pooled rate
+    pooled = (a + b) / (n + m)
+    error = math.sqrt(pooled * (1 - pooled) * (1 / n + 1 / m))
+    return 0.0 if error == 0 else (a / n - b / m) / error
+
+def check(variant, spec, num_games, seed, workers, tolerance):
+    # Compares the batch backend against the dealer for one lineup; returns
+    # None when the lineup does not seat in the variant
+    use_variant(variant)
+    try:
+        lineup = arena.parse_lineup(spec)
+    except ValueError:
+        return None
+
+    # Game wins move little when a rule goes wrong; the tie rate also covers
+    # how rounds are dealt and scored
+    dealer = arena.ParallelArena(lineup, seed, workers, metrics=True)
+    dealer_wins = dealer.run_games(num_games)
+    totals = {}
+    batch_wins = batch.run_batch(lineup, num_games, seed, totals=totals)
+    rows = [('%s (%s)' % (arena.NAMES[i], lineup[i]), dealer_wins[i], num_games, batch_wins[i], num_games) for i in range(len(lineup))]
+    rows.append(('ties', dealer.metrics.ties, dealer.metrics.rounds, totals['ties'], totals['rounds']))
+
+    passed = True
+    print('%s %s:' % (variant, spec))
+    for (name, a, n, b, m) in rows:
+        z = _z_score(a, n, b, m)
+        ok = abs(z) <= tolerance
+        passed = passed and ok
+        print('  %s: dealer %.1f%%  batch %.1f%%  z %+.2f%s' % (name, a * 100 / n, b * 100 / m, z, '' if ok else '  MISMATCH'))
+    return passed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=3000, help='games per lineup and backend')
+    parser.add_argument('--seed', type=int, default=0, help='master seed')
+    parser.add_argument('--workers', type=int, default=None, help='number of dealer worker processes')
+    parser.add_argument('--variant', action='append', choices=sorted(VARIANTS), help='variant to check; may be repeated (default: all)')
+    parser.add_argument('--lineup', action='append', help='comma-separated lineup of %s; may be repeated' % ' and '.join(sorted(batch.POLICY_TYPES)))
+    parser.add_argument('--tolerance', type=float, default=3.5, help='largest z score accepted per seat and for the tie rate')
+    args = parser.parse_args()
+
+    specs = args.lineup or LINEUPS
+    for spec in specs:
+        for kind in spec.split(','):
+            if kind.strip().lower() not in batch.POLICY_TYPES:
+                parser.error('Agent type %s is not supported by the batch backend' % kind)
+    if args.games < 1:
+        parser.error('--games must be positive')
+
+    failed = []
+    checked = 0
+    for variant in args.variant or sorted(VARIANTS):
+        for spec in specs:
+            passed = check(variant, spec, args.games, args.seed, args.workers, args.tolerance)
+            if passed is not None:
+                checked += 1
+                if not passed:
+                    failed.append('%s %s' % (variant, spec))
+
+    if not checked:
+        parser.error('No lineup seats in the chosen variants')
+    if failed:
+        print('Batch backend differs from the dealer for: %s' % ', '.join(failed))
+        sys.exit(1)
+    print('Batch backend matches the dealer for %i lineups' % checked)
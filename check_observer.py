@@ -0,0 +1,95 @@
+import argparse, sys
+
+import arena
+from card import VARIANTS, use_variant
+from observer import Observer
+
+class Mismatch(Exception):
+    pass
+
+class ShadowSeat:
+    # Passes the dealer's calls through to an agent running on the shared
+    # table and repeats them to a per-agent Observer, comparing the two after
+    # every call
+    def __init__(self, agent, names):
+        self.agent = agent
+        self.shadow = Observer(names)
+        self.log = []
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+    def _check(self, step):
+        self.log.append(step)
+        shadow = self.shadow
+        view = self.agent.observer
+        differences = []
+        for (mine, theirs) in zip(shadow.players, view.players):
+            if mine.cards.bits != theirs.cards.bits:
+                differences.append('%s set: %s / %s' % (mine, mine.cards, theirs.cards))
+        if shadow.deck_set.bits != view.deck_set.bits:
+            differences.append('deck set: %s / %s' % (shadow.deck_set, view.deck_set))
+        if shadow.deck_size != view.deck_size:
+            differences.append('deck size: %i / %i' % (shadow.deck_size, view.deck_size))
+        if differences:
+            raise Mismatch('%s, seat %i, after:\n  %s\nObserver / SharedObserver:\n  %s' % (self.agent.__class__.__name__, self.agent.player,
+                '\n  '.join(self.log), '\n  '.join(differences)))
+
+    def start_game(self):
+        self.agent.start_game()
+        self.shadow.start_game()
+
+    def start_round(self, card):
+        self.agent.start_round(card)
+        self.shadow.start_round(self.agent.player, card)
+        self.log = []
+        self._check('start with %i' % card)
+
+    def report_draw(self, card):
+        self.agent.report_draw(card)
+        self.shadow.report_draw(self.agent.player, card)
+        self._check('draw %i' % card)
+
+    def report_event(self, event):
+        self.agent.report_event(event)
+        self.shadow.report_event(event)
+        self._check(repr(event))
+
+    def end_round(self, cards, winner):
+        self.agent.end_round(cards, winner)
+        self.shadow.end_round(cards, winner)
+
+    def end_game(self, winner):
+        self.agent.end_game(winner)
+
+def check(lineup, num_games, seed):
+    names = arena.NAMES[:len(lineup)]
+    seats = [ShadowSeat(agent, names) for agent in arena.make_agents(lineup)]
+    games = arena.Arena(seats, seed, shared_observer=True)
+    try:
+        games.run_games(num_games)
+    finally:
+        for agent in games.agents:
+            if hasattr(agent, 'close'):
+                agent.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=100, help='games per lineup')
+    parser.add_argument('--seed', type=int, default=1, help='master seed')
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='classic', help='deck and table variant')
+    parser.add_argument('--lineup', action='append', help='comma-separated arena agent types; may be repeated (default: endgame,random,lowball,lowball)')
+    args = parser.parse_args()
+    use_variant(args.variant)
+
+    for spec in args.lineup or ['endgame,random,lowball,lowball']:
+        try:
+            lineup = arena.parse_lineup(spec)
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            check(lineup, args.games, args.seed)
+        except Mismatch as e:
+            print('%s: beliefs differ in %s' % (spec, e))
+            sys.exit(1)
+        print('%s: SharedObserver matches Observer over %i games' % (spec, args.games))
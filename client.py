@@ -0,0 +1,96 @@
+import argparse, asyncio, json, random, sys
+
+from card import Cards
+
+TARGETED = (Cards.GUARD, Cards.PRIEST, Cards.BARON, Cards.PRINCE, Cards.KING)
+
+def random_play(message, player, rng):
+    cards = message['cards']
+    if Cards.COUNTESS in cards and (Cards.PRINCE in cards or Cards.KING in cards):
+        return {'card': Cards.COUNTESS}
+
+    choices = [card for card in cards if card != Cards.PRINCESS] or cards
+    card = rng.choice(choices)
+    play = {'card': card}
+    if card in TARGETED:
+        targets = [target for target in message['targets'] if target != player or card == Cards.PRINCE]
+        play['target'] = rng.choice(targets)
+        if card == Cards.GUARD:
+            play['challenge'] = rng.randrange(Cards.PRIEST, Cards.NUM_CARDS)
+    return play
+
+async def prompt(text):
+    print(text, end='', flush=True)
+    return (await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)).strip()
+
+async def human_play(message, player, rng):
+    cards = message['cards']
+    while True:
+        line = await prompt('Cards %s; enter card [target [challenge]]: ' % '  '.join('[%i] %s' % (card, Cards.name(card)) for card in cards))
+        try:
+            fields = [int(field) for field in line.split()]
+        except ValueError:
+            continue
+        if fields:
+            return dict(zip(('card', 'target', 'challenge'), fields))
+
+async def run_client(host, port, name, human=False, rng=random, verbose=False):
+    (reader, writer) = await asyncio.open_connection(host, port)
+    writer.write(json.dumps({'type': 'join', 'name': name}).encode() + b'\n')
+    await writer.drain()
+
+    player = None
+    wins = None
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+        kind = message['type']
+        if verbose or human:
+            print('%s: %s' % (name, line.decode().strip()))
+
+        if kind == 'welcome':
+            player = message['player']
+        elif kind == 'turn':
+            if human:
+                play = await human_play(message, player, rng)
+            else:
+                play = random_play(message, player, rng)
+            play['id'] = message['id']
+            writer.write(json.dumps(play).encode() + b'\n')
+            await writer.drain()
+        elif kind == 'error' and player is None:
+            break
+        elif kind == 'bye':
+            wins = message['wins']
+            break
+
+    writer.close()
+    return (player, wins)
+
+async def run_clients(host, port, names, human, seed, verbose):
+    rngs = [random.Random('%s:%i' % (seed, i)) for i in range(len(names))]
+    return await asyncio.gather(*[run_client(host, port, name, human, rng, verbose) for (name, rng) in zip(names, rngs)])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', help='server address')
+    parser.add_argument('--port', type=int, default=4004, help='server port')
+    parser.add_argument('--name', default='Player', help='player name')
+    parser.add_argument('--clients', type=int, default=1, help='number of scripted clients to connect')
+    parser.add_argument('--human', action='store_true', help='play from the terminal instead of at random')
+    parser.add_argument('--seed', type=int, default=0, help='seed for scripted clients')
+    parser.add_argument('--verbose', action='store_true', help='print every message received')
+    args = parser.parse_args()
+
+    if args.human and args.clients != 1:
+        parser.error('--human plays a single seat')
+
+    names = [args.name] if args.clients == 1 else ['%s%i' % (args.name, i + 1) for i in range(args.clients)]
+    results = asyncio.run(run_clients(args.host, args.port, names, args.human, args.seed, args.verbose))
+    for (name, (player, wins)) in zip(names, results):
+        if wins is None:
+            print('%s: not seated' % name)
+        else:
+            print('%s (seat %i): table wins %s' % (name, player, wins))
@@ -0,0 +1,249 @@
+import argparse, json, os, shutil
+
+import numpy as np
+
+from card import Cards
+from dealer import Listener
+
+MANIFEST = 'manifest.json'
+VERSION = 1
+NONE = -1
+
+def columns(num_players):
+    # name -> (dtype, per-row shape). Seat-indexed columns are rotated so
+    # index 0 is the deciding player and index i the player i seats after it;
+    # target is likewise a seat offset.
+    return {
+        'game': ('int64', ()),
+        'round': ('int16', ()),
+        'turn': ('int16', ()),
+        'seat': ('int8', ()),
+        'agent': ('int8', ()),
+        'hand': ('int8', (2,)),
+        'beliefs': ('uint8', (num_players, Cards.NUM_CARDS)),
+        'deck_set': ('uint8', (Cards.NUM_CARDS,)),
+        'deck_size': ('int8', ()),
+        'handmaiden': ('bool', (num_players,)),
+        'out': ('bool', (num_players,)),
+        'scores': ('int8', (num_players,)),
+        'card': ('int8', ()),
+        'target': ('int8', ()),
+        'challenge': ('int8', ()),
+        'won': ('int8', ())
+        }
+
+def _read_manifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        return json.load(f)
+
+def load(path):
+    # Memory-maps every column; nothing is read until it is indexed
+    manifest = _read_manifest(path)
+    rows = manifest['rows']
+    ret = {}
+    for (name, (dtype, shape)) in manifest['columns'].items():
+        if rows:
+            ret[name] = np.memmap(os.path.join(path, name + '.bin'), dtype=dtype, mode='r', shape=(rows,) + tuple(shape))
+        else:
+            ret[name] = np.zeros((0,) + tuple(shape), dtype=dtype)
+    return (manifest, ret)
+
+class DecisionWriter(Listener):
+    # Records one row per get_play decision of every agent that keeps an
+    # Observer. Features are captured when the agent is asked, the play is
+    # taken from the event the dealer applied (so default plays are what is
+    # stored) and the outcome is filled in when the round ends. Rows are
+    # built in a fixed-size chunk buffer that is appended to one raw file per
+    # column, so the dataset never has to fit in memory.
+    def __init__(self, path, num_players, first_game=None, chunk_rows=8192):
+        if chunk_rows <= 2 * Cards.DECK_SIZE:
+            raise ValueError('chunk_rows must exceed two decks')
+        self.path = path
+        self.num_players = num_players
+        self.columns = columns(num_players)
+        self.classes = []
+        self.chunk_rows = chunk_rows
+        self.buffer = {name: np.zeros((chunk_rows,) + shape, dtype=dtype) for (name, (dtype, shape)) in self.columns.items()}
+        self.size = 0
+        self.done = 0
+        self.round_start = 0
+        self.pending = None
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, MANIFEST)):
+            self.manifest = _read_manifest(path)
+            if self.manifest['version'] != VERSION or self.manifest['players'] != num_players:
+                raise ValueError('%s holds a dataset for a different table' % path)
+        else:
+            self.manifest = {'version': VERSION, 'players': num_players, 'classes': [], 'rows': 0, 'games': 0,
+                'columns': {name: [dtype, list(shape)] for (name, (dtype, shape)) in self.columns.items()}}
+        self.game = (self.manifest['games'] if first_game is None else first_game) - 1
+
+        # Rows past the manifest were written by a run that stopped before
+        # recording them, so they are cut off before appending
+        self.files = {}
+        for name in self.columns:
+            f = open(os.path.join(path, name + '.bin'), 'ab')
+            size = self.manifest['rows'] * self.buffer[name][0].nbytes
+            if f.tell() < size:
+                raise ValueError('%s is shorter than its manifest' % f.name)
+            f.truncate(size)
+            self.files[name] = f
+
+    def attach(self, dealer):
+        names = [getattr(agent, 'agent_class', type(agent)).__name__ for agent in dealer.agents]
+        self._set_classes(sorted(set(names)))
+        self.agent_ids = [self.classes.index(name) for name in names]
+        for (seat, agent) in enumerate(dealer.agents):
+            if hasattr(agent, 'observer'):
+                agent.get_play = self._wrap(agent.get_play, agent, seat)
+        dealer.add_listener(self)
+
+    def _set_classes(self, classes):
+        if self.manifest['classes'] and self.manifest['classes'] != classes:
+            raise ValueError('%s holds a dataset for a different lineup' % self.path)
+        self.manifest['classes'] = classes
+        self.classes = classes
+
+    def _wrap(self, fn, agent, seat):
+        def get_play(*k, **kw):
+            self._capture(agent, seat)
+            return fn(*k, **kw)
+        return get_play
+
+    def _capture(self, agent, seat):
+        # Features go straight into the next free buffer row; a request
+        # repeated after an invalid play overwrites the same row
+        n = self.num_players
+        i = self.size
+        buffer = self.buffer
+        observer = agent.observer
+        players = observer.players
+        beliefs = buffer['beliefs'][i]
+        handmaiden = buffer['handmaiden'][i]
+        out = buffer['out'][i]
+        scores = buffer['scores'][i]
+        for offset in range(n):
+            player = players[(seat + offset) % n]
+            beliefs[offset] = player.cards.cards if offset else 0
+            handmaiden[offset] = player.handmaiden
+            out[offset] = player.out
+            scores[offset] = player.score
+
+        buffer['game'][i] = self.game
+        buffer['round'][i] = self.round
+        buffer['turn'][i] = self.turn
+        buffer['seat'][i] = seat
+        buffer['agent'][i] = self.agent_ids[seat]
+        buffer['hand'][i] = agent.cards[:2]
+        buffer['deck_set'][i] = observer.deck_set.cards
+        buffer['deck_size'][i] = observer.deck_size
+        self.pending = seat
+
+    def start_game(self):
+        self.game += 1
+        self.round = 0
+
+    def start_round(self, start_player):
+        self.turn = 0
+        self.pending = None
+        self.round_start = self.size
+
+    def report_play(self, event, player_event, target_event):
+        if self.pending == event.player:
+            i = self.size
+            buffer = self.buffer
+            buffer['card'][i] = event.card
+            buffer['target'][i] = NONE if event.target is None else (event.target - event.player) % self.num_players
+            buffer['challenge'][i] = NONE if event.challenge is None else event.challenge
+            self.size += 1
+        self.pending = None
+        self.turn += 1
+
+    def end_round(self, cards, winner):
+        rows = slice(self.round_start, self.size)
+        self.buffer['won'][rows] = self.buffer['seat'][rows] == (NONE if winner is None else winner)
+        self.round += 1
+        self.done = self.size
+        # A round adds at most one decision per card in the deck, so flush
+        # while the next round is sure to fit
+        if self.size + Cards.DECK_SIZE > self.chunk_rows:
+            self.flush()
+
+    def end_game(self, winner):
+        self.manifest['games'] = max(self.manifest['games'], self.game + 1)
+
+    def flush(self):
+        # Only finished rounds are written; the manifest follows the data so
+        # it never counts rows that are not on disk
+        done = self.done
+        buffer = self.buffer
+        for (name, f) in self.files.items():
+            f.write(buffer[name][:done].tobytes())
+            buffer[name][:self.size - done] = buffer[name][done:self.size]
+        if done:
+            self.manifest['rows'] += done
+            self.manifest['games'] = max(self.manifest['games'], int(buffer['game'][done - 1]) + 1)
+        self.size -= done
+        self.round_start = max(0, self.round_start - done)
+        self.done = 0
+        self._write_manifest()
+
+    def _write_manifest(self):
+        for f in self.files.values():
+            f.flush()
+        path = os.path.join(self.path, MANIFEST)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+            f.write('\n')
+        os.replace(path + '.tmp', path)
+
+    def merge(self, shard, offset, block_rows=1 << 16):
+        # Streams a shard's columns onto the end of this dataset, moving its
+        # game numbers past the ones already stored
+        self.flush()
+        (manifest, data) = load(shard)
+        if manifest['players'] != self.num_players:
+            raise ValueError('%s holds a dataset for a different table' % shard)
+        if manifest['classes']:
+            self._set_classes(manifest['classes'])
+        for (name, f) in self.files.items():
+            column = data[name]
+            if name == 'game':
+                for start in range(0, manifest['rows'], block_rows):
+                    f.write((column[start:start + block_rows] + offset).tobytes())
+            elif manifest['rows']:
+                with open(os.path.join(shard, name + '.bin'), 'rb') as src:
+                    shutil.copyfileobj(src, f)
+        self.manifest['rows'] += manifest['rows']
+        self.manifest['games'] = max(self.manifest['games'], offset + manifest['games'])
+        del data
+        self._write_manifest()
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+def remove_shard(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize a decision dataset written by love-letter.py --dataset')
+    parser.add_argument('path', help='dataset directory')
+    args = parser.parse_args()
+
+    (manifest, data) = load(args.path)
+    print('%i decisions from %i games, %i players, agents %s' % (manifest['rows'], manifest['games'], manifest['players'],
+        ', '.join(manifest['classes'])))
+    for (name, column) in data.items():
+        print('  %-10s %-6s %s' % (name, column.dtype, column.shape))
+    if manifest['rows']:
+        won = data['won']
+        for (i, name) in enumerate(manifest['classes']):
+            mine = data['agent'] == i
+            if mine.any():
+                counts = np.bincount(data['card'][mine], minlength=Cards.NUM_CARDS)
+                print('  %s: %i decisions, %.1f%% in rounds won; plays %s' % (name, mine.sum(), won[mine].mean() * 100,
+                    '  '.join('%s:%i' % (Cards.name(card), counts[card]) for card in range(Cards.GUARD, Cards.NUM_CARDS))))
@@ -2,16 +2,33 @@ import random
 
 from log import Log
 from card import Cards
+from observer import TableObserver
+from event import PlayEvent
+
+report_log = Log.zone('report')
+dealer_log = Log.zone('dealer')
 
 class Deck:
     def __init__(self):
+        self.cards = []
         self.reset()
 
-    def reset(self):
-        self.cards = []
-        for card in range(Cards.GUARD, Cards.NUM_CARDS):
-            self.cards.extend([card for i in range(Cards.start_count(card))])
-        random.shuffle(self.cards)
+    @staticmethod
+    def shuffled(rng=random):
+        cards = list(Cards.TEMPLATE)
+        rng.shuffle(cards)
+        return cards
+
+    def reset(self, order=None):
+        # Refill the same list in place rather than building a new deck
+        cards = self.cards
+        if order is None:
+            cards[:] = Cards.TEMPLATE
+            random.shuffle(cards)
+        else:
+            # Cards are drawn from the end of the list
+            cards[:] = order
+            cards.reverse()
 
     def draw(self):
         return self.cards.pop()
@@ -19,6 +36,24 @@ class Deck:
     def remaining(self):
         return len(self.cards)
 
+class DeckSequence:
+    # Repeatable card orders, one per round, generated lazily from a seed so
+    # the same deal set can be replayed with different seatings
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.orders = []
+
+    def __getitem__(self, i):
+        while len(self.orders) <= i:
+            self.orders.append(Deck.shuffled(self.rng))
+        return self.orders[i]
+
+    def __iter__(self):
+        i = 0
+        while True:
+            yield self[i]
+            i += 1
+
 class AgentInfo:
     def __init__(self, number, agent):
         self.cards = []
@@ -27,14 +62,53 @@ class AgentInfo:
         self.handmaiden = False
         self.agent = agent
 
+class Listener:
+    def start_game(self):
+        pass
+
+    def start_round(self, start_player):
+        pass
+
+    def report_deal(self, player, card):
+        pass
+
+    def report_draw(self, player, card):
+        pass
+
+    def report_play(self, event, player_event, target_event):
+        pass
+
+    def end_round(self, cards, winner):
+        pass
+
+    def end_game(self, winner):
+        pass
+
 class Dealer:
-    def __init__(self, agents):
+    MAX_INVALID = 3
+
+    def __init__(self, agents, shared_observer=False):
         self.agents = agents
         self.deck = Deck()
         self.agent_info = [AgentInfo(i, agent) for (i, agent) in enumerate(self.agents)]
+        self.listeners = []
+        self.deck_orders = None
+        self.penalties = [0 for agent in self.agents]
+        self.final_cards = [None for agent in self.agents]
+        for agent in self.agents:
+            if not hasattr(agent, 'report_event'):
+                agent.report_event = lambda event, agent=agent: agent.report_play(**event.kwargs())
+        self.table = None
+        if shared_observer:
+            self.table = TableObserver([agent.name for agent in self.agents])
+            for agent in self.agents:
+                agent.share_observer(self.table)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
 
     def _validate_play(self, play, player):
-        if 'card' not in play:
+        if not isinstance(play, dict) or 'card' not in play:
             return False
         card = play['card']
 
@@ -59,99 +133,143 @@ class Dealer:
 
         return True
 
-    def _report_play(self, *k, **kw):
-        player = kw['player']
-        card = kw['card']
-        target = kw.get('target', None)
-        discard = kw.get('discard', None)
-
-        Log.print('report: ')
+    def _default_play(self, player):
+        # The lowest card, aimed at the next player still in the round
+        cards = sorted(self.agent_info[player].cards)
+        if Cards.COUNTESS in cards and (Cards.PRINCE in cards or Cards.KING in cards):
+            return {'card': Cards.COUNTESS}
+
+        play = {'card': cards[0]}
+        if cards[0] in (Cards.GUARD, Cards.PRIEST, Cards.BARON, Cards.PRINCE, Cards.KING):
+            num_players = len(self.agents)
+            targets = [(player + i) % num_players for i in range(1, num_players) if not self.agent_info[(player + i) % num_players].out]
+            play['target'] = targets[0] if targets else player
+            if cards[0] == Cards.GUARD:
+                play['challenge'] = Cards.PRIEST
+        return play
+
+    def _report_play(self, event):
+        if not report_log.enabled:
+            return
+
+        player = event.player
+        card = event.card
+        target = event.target
+        discard = event.discard
+
+        report_log.print('')
         if target is not None:
-            Log.print('report: %s plays card %s on %s' %(self.agents[player], Cards.name(card), self.agents[target]))
+            report_log.print('%s plays card %s on %s', self.agents[player], Cards.name(card), self.agents[target])
         else:
-            Log.print('report: %s plays card %s' % (self.agents[player], Cards.name(card)))
+            report_log.print('%s plays card %s', self.agents[player], Cards.name(card))
 
         if target is not None:
             if self.agent_info[target].handmaiden:
-                Log.print('report: %s is unaffected due to HANDMAIDEN' % self.agents[target])
+                report_log.print('%s is unaffected due to HANDMAIDEN', self.agents[target])
             else:
                 if card == Cards.GUARD:
-                    challenge = kw['challenge']
-                    Log.print('report: %s is accused of having card %s' % (self.agents[target], Cards.name(challenge)))
+                    challenge = event.challenge
+                    report_log.print('%s is accused of having card %s', self.agents[target], Cards.name(challenge))
                     if discard:
-                        Log.print('report: %s discards card %s' % (self.agents[target], Cards.name(discard)))
-                        Log.print('report: %s is out' % self.agents[target])
+                        report_log.print('%s discards card %s', self.agents[target], Cards.name(discard))
+                        report_log.print('%s is out', self.agents[target])
                     else:
-                        Log.print('report: %s does not have card %s' % (self.agents[target], Cards.name(challenge)))
+                        report_log.print('%s does not have card %s', self.agents[target], Cards.name(challenge))
                 elif card == Cards.BARON:
-                    loser = kw.get('loser', None)
+                    loser = event.loser
                     if loser is not None:
-                        Log.print('report: %s loses challenge, discards card %s' % (self.agents[loser], Cards.name(discard)))
-                        Log.print('report: %s is out' % self.agents[loser])
+                        report_log.print('%s loses challenge, discards card %s', self.agents[loser], Cards.name(discard))
+                        report_log.print('%s is out', self.agents[loser])
                 elif card == Cards.PRINCE:
-                    Log.print('report: %s discards card %s' % (self.agents[target], Cards.name(discard)))
+                    report_log.print('%s discards card %s', self.agents[target], Cards.name(discard))
                     if discard == Cards.PRINCESS:
-                        Log.print('report: %s is out' % self.agents[target])
+                        report_log.print('%s is out', self.agents[target])
 
         if card == Cards.PRINCESS:
-            Log.print('report: %s is out' % self.agents[player])
+            report_log.print('%s is out', self.agents[player])
 
-    def _process_play(self, play, player):
-        report = {}
-        report_player = {}
-        report_target = {}
+    def _report_round_start(self, player):
+        if dealer_log.enabled:
+            dealer_log.print('Round starts with %s', self.agents[player].name)
+
+    def _report_round_end(self, cards, winner):
+        if not report_log.enabled:
+            return
+
+        report_log.print('')
+        report_log.print('Round is over')
+        report_log.print('Final cards:')
+        for (i, card) in enumerate(cards):
+            if card is not None:
+                report_log.print('  %s: %s', self.agents[i], Cards.name(card))
+
+        if winner is None:
+            report_log.print('Tie: No winner')
+        else:
+            report_log.print('Winner: %s', self.agents[winner])
+
+    def _report_game_end(self, winner):
+        if not report_log.enabled:
+            return
+
+        report_log.print('')
+        report_log.print('Game is over')
+        report_log.print('Winner: %s', self.agents[winner])
+
+    def _draw_card(self, info):
+        card = self.deck.draw()
+        if dealer_log.enabled:
+            dealer_log.print('Dealing %s to %s', Cards.name(card), info.agent)
+        return card
+
+    def _apply_play(self, play, player):
+        challenge = discard = loser = None
+        player_other = target_other = new_card = None
         card = play['card']
-        report['card'] = card
-        report['player'] = player
         player_info = self.agent_info[player]
         player_info.handmaiden = False
         player_info.cards.remove(card)
 
         target = play.get('target', None)
         if target is not None:
-            report['target'] = target
             target_info = self.agent_info[target]
 
             if not target_info.handmaiden:
                 if card == Cards.GUARD:
                     challenge = play['challenge']
-                    report['challenge'] = challenge
 
                     if challenge in target_info.cards:
-                        report['discard'] = challenge
+                        discard = challenge
                         target_info.cards.remove(challenge)
                         target_info.out = True
                 elif card == Cards.PRIEST:
-                    report_player['other_card'] = target_info.cards[0]
+                    player_other = target_info.cards[0]
                 elif card == Cards.BARON:
                     player_card = player_info.cards[0]
                     target_card = target_info.cards[0]
                     if target_card > player_card:
-                        report['loser'] = player
-                        report['discard'] = player_card
-                        report_player['other_card'] = target_card
+                        loser = player
+                        discard = player_card
+                        player_other = target_card
                         player_info.cards.remove(player_card)
                         player_info.out = True
                     elif target_card < player_card:
-                        report['loser'] = target
-                        report['discard'] = target_card
-                        report_target['other_card'] = player_card
+                        loser = target
+                        discard = target_card
+                        target_other = player_card
                         target_info.cards.remove(target_card)
                         target_info.out = True
                 elif card == Cards.PRINCE:
                     discard = target_info.cards[0]
-                    report['discard'] = discard
                     target_info.cards.remove(discard)
                     if discard == Cards.PRINCESS:
                         target_info.out = True
                     else:
-                        new_card = self.deck.draw()
-                        Log.print('dealer: Dealing %s to %s' % (Cards.name(card), self.agents[target].name))
-                        report_target['new_card'] = new_card
+                        new_card = self._draw_card(target_info)
                         target_info.cards.append(new_card)
                 elif card == Cards.KING:
-                    report_player['other_card'] = target_info.cards[0]
-                    report_target['other_card'] = player_info.cards[0]
+                    player_other = target_info.cards[0]
+                    target_other = player_info.cards[0]
                     target_info.cards, player_info.cards = player_info.cards, target_info.cards
 
         if card == Cards.HANDMAIDEN:
@@ -159,43 +277,79 @@ class Dealer:
         elif card == Cards.PRINCESS:
             player_info.out = True
 
-        self._report_play(**report)
+        event = PlayEvent(player, card, target, challenge, discard, loser)
+        player_event = target_event = event
+        if player_other is not None:
+            player_event = event.private(other_card=player_other)
+        if target_other is not None or new_card is not None:
+            target_event = event.private(other_card=target_other, new_card=new_card)
+            if target == player:
+                player_event = target_event
 
-        for i in range(len(self.agents)):
-            report_agent = {}
-            report_agent.update(report)
+        return (event, player_event, target_event)
 
-            if i == player:
-                report_agent.update(report_player)
-            if target is not None and i == target:
-                report_agent.update(report_target)
+    def _process_play(self, play, player):
+        (event, player_event, target_event) = self._apply_play(play, player)
+        if self.table is not None:
+            self.table.report_event(event)
+        for listener in self.listeners:
+            listener.report_play(event, player_event, target_event)
 
-            self.agents[i].report_play(**report_agent)
+        self._report_play(event)
 
-    def do_round(self, start_player):
-        self.deck.reset()
-        for info in self.agent_info:
-            card = self.deck.draw()
-            Log.print('dealer: Dealing %s to %s' % (Cards.name(card), info.agent))
-            info.cards = [card]
+        target = event.target
+        for (i, agent) in enumerate(self.agents):
+            if i == player:
+                agent.report_event(player_event)
+            elif i == target:
+                agent.report_event(target_event)
+            else:
+                agent.report_event(event)
+
+    def _round(self, start_player):
+        # Plays a round, yielding the player to move and receiving its play,
+        # so the same rules drive both blocking and asyncio dealers
+        self.deck.reset(next(self.deck_orders) if self.deck_orders is not None else None)
+        for i in range(Cards.BURN):
+            self.deck.draw()
+        if self.table is not None:
+            self.table.start_round()
+        for listener in self.listeners:
+            listener.start_round(start_player)
+        for (i, info) in enumerate(self.agent_info):
+            card = self._draw_card(info)
+            info.cards.clear()
+            info.cards.append(card)
             info.out = False
             info.handmaiden = False
+            for listener in self.listeners:
+                listener.report_deal(i, card)
             info.agent.start_round(card)
 
         current = start_player
-        Log.print('dealer: Round starts with %s' % self.agents[current].name)
+        self._report_round_start(current)
         while self.deck.remaining() > 1:
             info = self.agent_info[current]
             if not info.out:
-                card = self.deck.draw()
-                Log.print('dealer: Dealing %s to %s' % (Cards.name(card), info.agent))
+                card = self._draw_card(info)
                 info.cards.append(card)
+                for listener in self.listeners:
+                    listener.report_draw(current, card)
                 info.agent.report_draw(card)
 
-                play = info.agent.get_play()
-                if not self._validate_play(play, current):
-                    Log.print('dealer: Invalid play %s' % play)
-                    continue
+                # Asking again rather than dealing another card; an agent
+                # that forfeits or keeps failing gets the default play
+                play = yield current
+                invalid = 0
+                while not self._validate_play(play, current):
+                    invalid += 1
+                    if play is None or invalid >= Dealer.MAX_INVALID:
+                        self.penalties[current] += 1
+                        play = self._default_play(current)
+                        dealer_log.print('Default play %s for %s', play, info.agent)
+                        break
+                    dealer_log.print('Invalid play %s', play)
+                    play = yield current
 
                 self._process_play(play, current)
 
@@ -205,39 +359,65 @@ class Dealer:
 
             current = (current + 1) % len(self.agents)
 
-        cards = [None if info.out else info.cards[0] for info in self.agent_info]
-
-        Log.print('report:')
-        Log.print('report: Round is over')
-        Log.print('report: Final cards:')
-        for (i, card) in enumerate(cards):
-            if card is not None:
-                Log.print('report:   %s: %s' % (self.agents[i], Cards.name(card)))
-
-        lst = [i for i in range(len(cards))]
-        lst = sorted(lst, key=lambda x: cards[x] or 0)
+        # The scan reuses one list; every recipient gets the same tuple, which
+        # is safe to keep past the round
+        final_cards = self.final_cards
         winner = None
-        if cards[lst[-1]] == cards[lst[-2]]:
-            Log.print('report: Tie: No winner')
-        else:
-            winner = lst[-1]
-            Log.print('report: Winner: %s' % self.agents[winner])
+        best = 0
+        for (i, info) in enumerate(self.agent_info):
+            card = None if info.out else info.cards[0]
+            final_cards[i] = card
+            if card is not None and card > best:
+                (winner, best) = (i, card)
+        cards = tuple(final_cards)
+        if winner is not None and cards.count(best) > 1:
+            winner = None
+        if winner is not None:
             self.agent_info[winner].score += 1
 
+        self._report_round_end(cards, winner)
+
+        if self.table is not None:
+            self.table.end_round(cards, winner)
+        for listener in self.listeners:
+            listener.end_round(cards, winner)
         for agent in self.agents:
             agent.end_round(cards, winner)
 
         return winner
 
-    def do_game(self):
+    def do_round(self, start_player):
+        rounds = self._round(start_player)
+        try:
+            player = next(rounds)
+            while True:
+                player = rounds.send(self.agents[player].get_play())
+        except StopIteration as e:
+            return e.value
+
+    def _start_game(self):
         for info in self.agent_info:
             info.score = 0
-        start_player = 0
-        winner = None
 
+        if self.table is not None:
+            self.table.start_game()
+        for listener in self.listeners:
+            listener.start_game()
         for agent in self.agents:
             agent.start_game()
 
+    def _end_game(self, winner):
+        for agent in self.agents:
+            agent.end_game(winner)
+        for listener in self.listeners:
+            listener.end_game(winner)
+
+        self._report_game_end(winner)
+
+    def do_game(self):
+        self._start_game()
+        start_player = 0
+        winner = None
         while True:
             winner = self.do_round(start_player)
             if winner is not None:
@@ -245,11 +425,21 @@ class Dealer:
                 if self.agent_info[winner].score == 4:
                     break
 
-        for agent in self.agents:
-            agent.end_game(winner)
+        self._end_game(winner)
+        return winner
 
-        Log.print('report:')
-        Log.print('report: Game is over')
-        Log.print('report: Winner: %s' % self.agents[winner])
+class HeadlessDealer(Dealer):
+    def _report_play(self, event):
+        pass
 
-        return winner
+    def _report_round_start(self, player):
+        pass
+
+    def _report_round_end(self, cards, winner):
+        pass
+
+    def _report_game_end(self, winner):
+        pass
+
+    def _draw_card(self, info):
+        return self.deck.draw()
@@ -0,0 +1,229 @@
+import time
+
+from agent import EndgameAgent, ai_log
+from card import Cards, CardSet
+from ismcts import Position, to_play
+
+class Timeout(Exception):
+    pass
+
+def _distinct(deck, top):
+    counts = {}
+    for card in deck[:top]:
+        counts[card] = counts.get(card, 0) + 1
+    return counts
+
+class DeterminizedSolver:
+    # Perfect-information Monte Carlo over the last few draws, enumerated
+    # rather than sampled. Hidden hands are dealt from the searcher's beliefs
+    # at the root only; below it every player sees the deal and picks the
+    # play that maximizes its own chance of taking the round, draws are
+    # chance nodes over the unseen deck, and a GUARD guess is spread over the
+    # cards the guesser cannot see. The value of a root play is therefore an
+    # optimistic estimate averaged over deals, not a solve of the
+    # information set.
+    def __init__(self, table_size=1 << 18, time_limit=0.1):
+        self.table = {}
+        self.table_size = table_size
+        self.time_limit = time_limit
+        self.deadline = None
+        self.nodes = 0
+
+    def _key(self, state):
+        return (tuple(state.hand), state.drawn, state.current, state.protected, tuple(sorted(state.deck[:state.top])))
+
+    def _terminal(self, state):
+        value = [0.0] * len(state.hand)
+        if state.winner is not None:
+            value[state.winner] = 1.0
+        return value
+
+    def _plays(self, state):
+        plays = []
+        for (card, target, challenge) in state.legal_plays():
+            if card == Cards.PRINCESS:
+                continue
+            if card == Cards.GUARD:
+                if challenge != Cards.PRIEST:
+                    continue
+                challenge = None
+            plays.append((card, target, challenge))
+        return plays or state.legal_plays()
+
+    def _value(self, state):
+        if state.done:
+            return self._terminal(state)
+
+        key = self._key(state)
+        value = self.table.get(key)
+        if value is not None:
+            return value
+
+        self.nodes += 1
+        if self.nodes & 0xff == 0 and self.deadline is not None and time.perf_counter() > self.deadline:
+            raise Timeout()
+
+        player = state.current
+        for play in self._plays(state):
+            candidate = self._play_value(state, play)
+            if value is None or candidate[player] > value[player]:
+                value = candidate
+
+        if len(self.table) >= self.table_size:
+            del self.table[next(iter(self.table))]
+        self.table[key] = value
+        return value
+
+    def _guesses(self, state, target):
+        # Cards the guesser cannot see: the deck and every other live hand
+        counts = _distinct(state.deck, state.top)
+        for (i, card) in enumerate(state.hand):
+            if card and i != state.current:
+                counts[card] = counts.get(card, 0) + 1
+        counts.pop(Cards.GUARD, None)
+        return counts
+
+    def _play_value(self, state, play):
+        (card, target, challenge) = play
+        if card == Cards.GUARD and challenge is None:
+            guesses = self._guesses(state, target)
+            total = sum(guesses.values())
+            if not total:
+                return self._step_value(state, (card, target, Cards.PRIEST))
+            value = [0.0] * len(state.hand)
+            for (guess, count) in guesses.items():
+                for (i, v) in enumerate(self._step_value(state, (card, target, guess))):
+                    value[i] += v * count / total
+            return value
+        return self._step_value(state, play)
+
+    def _step_value(self, state, play):
+        # How many cards a play draws does not depend on which cards they are,
+        # so try it once and then enumerate the deck for that many draws
+        top = state.top
+        mark = state.snapshot()
+        state.step(*play)
+        draws = top - state.top
+        if draws == 0:
+            value = self._value(state)
+            state.undo(mark)
+            return value
+        state.undo(mark)
+
+        value = [0.0] * len(state.hand)
+        self._draw(state, play, top, draws, 1.0, value)
+        return value
+
+    def _draw(self, state, play, top, draws, weight, value):
+        deck = state.deck
+        slot = top - 1
+        for (card, count) in _distinct(deck, top).items():
+            j = deck.index(card, 0, top)
+            (deck[j], deck[slot]) = (deck[slot], deck[j])
+            p = weight * count / top
+            if draws > 1:
+                self._draw(state, play, top - 1, draws - 1, p, value)
+            else:
+                mark = state.snapshot()
+                state.step(*play)
+                for (i, v) in enumerate(self._value(state)):
+                    value[i] += v * p
+                state.undo(mark)
+            (deck[j], deck[slot]) = (deck[slot], deck[j])
+
+    def _deals(self, position, supports):
+        # Every joint assignment of opponent hands allowed by the beliefs,
+        # weighted by the number of ways to deal it from the unseen cards
+        counts = [(position.pool >> (card * CardSet.BITS)) & CardSet.MASK for card in range(Cards.NUM_CARDS)]
+        order = [i for (i, support) in enumerate(supports) if support is not None]
+        deals = []
+
+        def set_aside(surplus, first, taken, hands, weight):
+            # The observer can count a card twice as unseen (a PRINCE played
+            # on oneself); the extra cards are set aside as a multiset, taken
+            # in non-decreasing order with C(n, k) ways for k copies of a card
+            if surplus == 0:
+                deck = []
+                for (card, count) in enumerate(counts):
+                    deck.extend([card] * count)
+                deals.append((dict(hands), deck, weight))
+                return
+            for card in range(first, Cards.NUM_CARDS):
+                if counts[card]:
+                    copies = taken + 1 if card == first else 1
+                    ways = counts[card] / copies
+                    counts[card] -= 1
+                    set_aside(surplus - 1, card, copies, hands, weight * ways)
+                    counts[card] += 1
+
+        def deal(k, hands, weight):
+            if k == len(order):
+                surplus = sum(counts) - position.deck_size
+                if surplus >= 0:
+                    set_aside(surplus, Cards.GUARD, 0, hands, weight)
+                return
+            i = order[k]
+            support = supports[i]
+            for card in range(Cards.GUARD, Cards.NUM_CARDS):
+                if counts[card] and (support >> (card * CardSet.BITS)) & CardSet.MASK:
+                    weight_card = counts[card]
+                    counts[card] -= 1
+                    hands[i] = card
+                    deal(k + 1, hands, weight * weight_card)
+                    counts[card] += 1
+            hands.pop(i, None)
+
+        deal(0, {}, 1)
+        return deals
+
+    def solve(self, position):
+        # Returns (play, estimated win probability), or None if the latency
+        # cap is hit. Marginal beliefs can be jointly inconsistent, in which
+        # case any deal of the unseen cards is allowed
+        self.deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        deals = self._deals(position, position.supports)
+        if not deals:
+            deals = self._deals(position, [None if support is None else CardSet.ALL for support in position.supports])
+        if not deals:
+            return None
+
+        player = position.player
+        totals = {}
+        total_weight = 0
+        try:
+            for (hands, deck, weight) in deals:
+                if self.deadline is not None and time.perf_counter() > self.deadline:
+                    raise Timeout()
+                state = position.state(hands, deck)
+                total_weight += weight
+                plays = state.legal_plays()
+                for play in plays:
+                    if play[0] == Cards.PRINCESS and len(plays) > 1:
+                        continue
+                    totals[play] = totals.get(play, 0.0) + weight * self._step_value(state, play)[player]
+        except Timeout:
+            return None
+        finally:
+            self.deadline = None
+
+        play = max(totals, key=lambda play: totals[play])
+        return (play, totals[play] / total_weight)
+
+class SolverAgent(EndgameAgent):
+    def __init__(self, player, names, time_limit=0.1, table_size=1 << 18):
+        super(SolverAgent, self).__init__(player, names)
+        self.solver = DeterminizedSolver(table_size, time_limit)
+
+    def get_play(self):
+        if self.observer.deck_size <= len(self.observer.players) and not self._get_required_play():
+            position = Position.from_observer(self.observer, self.player, self.cards)
+            result = self.solver.solve(position)
+            if result is not None:
+                ((card, target, challenge), chance) = result
+                if ai_log.enabled:
+                    ai_log.print('%s endgame estimate: %s wins %i%%', self.name, Cards.name(card), chance * 100)
+                return to_play((self.player, card, target, challenge))
+            if ai_log.enabled:
+                ai_log.print('%s endgame solver gave up', self.name)
+
+        return super(SolverAgent, self).get_play()
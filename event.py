@@ -0,0 +1,26 @@
+from collections import namedtuple
+
+class PlayEvent(namedtuple('PlayEvent', ('player', 'card', 'target', 'challenge', 'discard', 'loser', 'other_card', 'new_card'),
+        defaults=(None,) * 6)):
+    # The public fields are shared by every recipient of a play, so events
+    # are read-only tuples; the player and target get a private copy only
+    # when they learn other_card/new_card.
+    __slots__ = ()
+
+    def private(self, other_card=None, new_card=None):
+        return PlayEvent(self.player, self.card, self.target, self.challenge, self.discard, self.loser, other_card, new_card)
+
+    def kwargs(self):
+        kw = {}
+        for (field, value) in zip(self._fields, self):
+            if value is not None:
+                kw[field] = value
+        return kw
+
+    @staticmethod
+    def from_kwargs(kw):
+        return PlayEvent(kw['player'], kw['card'], kw.get('target', None), kw.get('challenge', None),
+            kw.get('discard', None), kw.get('loser', None), kw.get('other_card', None), kw.get('new_card', None))
+
+    def __repr__(self):
+        return 'PlayEvent(%s)' % ', '.join('%s=%s' % item for item in self.kwargs().items())
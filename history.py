@@ -0,0 +1,222 @@
+import argparse, os, sqlite3, sys
+
+from card import Cards
+from dealer import Listener
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cards (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE IF NOT EXISTS games (id INTEGER PRIMARY KEY, players INTEGER, rounds INTEGER, winner INTEGER, winner_class TEXT);
+CREATE TABLE IF NOT EXISTS seats (game_id INTEGER, seat INTEGER, class TEXT, score INTEGER);
+CREATE TABLE IF NOT EXISTS rounds (game_id INTEGER, round INTEGER, start_player INTEGER, turns INTEGER, winner INTEGER);
+CREATE TABLE IF NOT EXISTS hands (game_id INTEGER, round INTEGER, seat INTEGER, class TEXT, card INTEGER, won INTEGER);
+CREATE TABLE IF NOT EXISTS plays (game_id INTEGER, round INTEGER, turn INTEGER, seat INTEGER, class TEXT, card INTEGER,
+    held INTEGER, target INTEGER, challenge INTEGER, discard INTEGER, loser INTEGER, eliminated INTEGER, won INTEGER);
+'''
+
+# Built once when a store is closed rather than maintained during ingest
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS seats_class ON seats (class);
+CREATE INDEX IF NOT EXISTS rounds_game ON rounds (game_id, round);
+CREATE INDEX IF NOT EXISTS hands_card ON hands (card, won);
+CREATE INDEX IF NOT EXISTS hands_class ON hands (class, won);
+CREATE INDEX IF NOT EXISTS plays_card ON plays (card, held);
+CREATE INDEX IF NOT EXISTS plays_outcome ON plays (won, turn);
+CREATE INDEX IF NOT EXISTS plays_class ON plays (class, card);
+CREATE INDEX IF NOT EXISTS plays_loser ON plays (loser);
+'''
+
+INSERTS = {
+    'games': 'INSERT INTO games VALUES (?, ?, ?, ?, ?)',
+    'seats': 'INSERT INTO seats VALUES (?, ?, ?, ?)',
+    'rounds': 'INSERT INTO rounds VALUES (?, ?, ?, ?, ?)',
+    'hands': 'INSERT INTO hands VALUES (?, ?, ?, ?, ?, ?)',
+    'plays': 'INSERT INTO plays VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
+    }
+
+# Copies a shard into the store, moving its game ids past the existing ones
+MERGES = {
+    'games': 'INSERT INTO games SELECT id + ?1, players, rounds, winner, winner_class FROM shard.games',
+    'seats': 'INSERT INTO seats SELECT game_id + ?1, seat, class, score FROM shard.seats',
+    'rounds': 'INSERT INTO rounds SELECT game_id + ?1, round, start_player, turns, winner FROM shard.rounds',
+    'hands': 'INSERT INTO hands SELECT game_id + ?1, round, seat, class, card, won FROM shard.hands',
+    'plays': 'INSERT INTO plays SELECT game_id + ?1, round, turn, seat, class, card, held, target, challenge, discard, loser, eliminated, won FROM shard.plays'
+    }
+
+QUERIES = {
+    'classes': ('Game win rate per agent class',
+        'SELECT class, COUNT(*) AS seats, ROUND(AVG(games.winner = seats.seat) * 100, 1) AS win_pct '
+        'FROM seats JOIN games ON games.id = seats.game_id GROUP BY class ORDER BY win_pct DESC'),
+    'final-cards': ('Round win rate by card held at the showdown',
+        'SELECT name AS card, COUNT(*) AS hands, ROUND(AVG(won) * 100, 1) AS win_pct '
+        'FROM hands JOIN cards ON cards.id = hands.card GROUP BY card ORDER BY card'),
+    'baron-losses': ('Card kept by players who lost their own BARON play',
+        'SELECT name AS held, COUNT(*) AS losses FROM plays JOIN cards ON cards.id = plays.held '
+        'WHERE plays.card = 3 AND loser = seat GROUP BY held ORDER BY losses DESC'),
+    'eliminations': ('Eliminations per card played and agent class',
+        'SELECT class, name AS card, COUNT(*) AS eliminations FROM plays JOIN cards ON cards.id = plays.card '
+        'WHERE eliminated IS NOT NULL GROUP BY class, plays.card ORDER BY class, plays.card'),
+    'holding': ('Round win rate per turn when holding --card at that turn',
+        'SELECT turn, COUNT(*) AS decisions, ROUND(AVG(won) * 100, 1) AS win_pct FROM plays '
+        'WHERE card = :card OR held = :card GROUP BY turn ORDER BY turn')
+    }
+
+def connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.executescript(SCHEMA)
+    with connection:
+        connection.executemany('INSERT OR IGNORE INTO cards VALUES (?, ?)', enumerate(Cards.names))
+    return connection
+
+class History(Listener):
+    # Writes dealer events as rows of games, seats, rounds, hands and plays.
+    # Rows are buffered and written with executemany in one transaction per
+    # batch of games; ParallelArena workers write shards that are merged
+    # into the main store with INSERT ... SELECT.
+    def __init__(self, path, first_game=0, batch_games=1000):
+        self.path = path
+        self.connection = connect(path)
+        self.game = first_game - 1
+        self.batch_games = batch_games
+        self.pending = 0
+        self.rows = {table: [] for table in INSERTS}
+        self.classes = []
+
+    def attach(self, dealer):
+        self.classes = [getattr(agent, 'agent_class', type(agent)).__name__ for agent in dealer.agents]
+        dealer.add_listener(self)
+
+    def next_game(self):
+        (last,) = self.connection.execute('SELECT MAX(id) FROM games').fetchone()
+        return 0 if last is None else last + 1
+
+    def start_game(self):
+        self.game += 1
+        self.round = 0
+        self.scores = [0 for name in self.classes]
+
+    def start_round(self, start_player):
+        self.start_player = start_player
+        self.turn = 0
+        self.hands = [[] for name in self.classes]
+        self.plays = []
+
+    def report_deal(self, player, card):
+        self.hands[player].append(card)
+
+    def report_draw(self, player, card):
+        self.hands[player].append(card)
+
+    def report_play(self, event, player_event, target_event):
+        hands = self.hands
+        player = event.player
+        card = event.card
+        target = event.target
+        hand = hands[player]
+        hand.remove(card)
+        held = hand[0] if hand else None
+
+        eliminated = None
+        if card == Cards.GUARD and event.discard:
+            hands[target].clear()
+            eliminated = target
+        elif card == Cards.BARON and event.loser is not None:
+            hands[event.loser].clear()
+            eliminated = event.loser
+        elif card == Cards.PRINCE and event.discard is not None:
+            hands[target].remove(event.discard)
+            if event.discard == Cards.PRINCESS:
+                eliminated = target
+            else:
+                hands[target].append(target_event.new_card)
+        elif card == Cards.KING and player_event.other_card is not None:
+            (hands[player], hands[target]) = (hands[target], hands[player])
+        elif card == Cards.PRINCESS:
+            hand.clear()
+            eliminated = player
+
+        self.plays.append([self.game, self.round, self.turn, player, self.classes[player], card, held, target,
+            event.challenge, event.discard, event.loser, eliminated, 0])
+        self.turn += 1
+
+    def end_round(self, cards, winner):
+        rows = self.rows
+        for play in self.plays:
+            play[-1] = int(play[3] == winner)
+        rows['plays'].extend(self.plays)
+        rows['rounds'].append((self.game, self.round, self.start_player, self.turn, winner))
+        for (seat, card) in enumerate(cards):
+            rows['hands'].append((self.game, self.round, seat, self.classes[seat], card, int(seat == winner)))
+        if winner is not None:
+            self.scores[winner] += 1
+        self.round += 1
+
+    def end_game(self, winner):
+        rows = self.rows
+        rows['games'].append((self.game, len(self.classes), self.round, winner, self.classes[winner]))
+        for (seat, name) in enumerate(self.classes):
+            rows['seats'].append((self.game, seat, name, self.scores[seat]))
+        self.pending += 1
+        if self.pending >= self.batch_games:
+            self.flush()
+
+    def flush(self):
+        with self.connection:
+            for (table, rows) in self.rows.items():
+                if rows:
+                    self.connection.executemany(INSERTS[table], rows)
+                    rows.clear()
+        self.pending = 0
+
+    def merge(self, shard, offset):
+        self.flush()
+        self.connection.execute('ATTACH DATABASE ? AS shard', (shard,))
+        try:
+            with self.connection:
+                for sql in MERGES.values():
+                    self.connection.execute(sql, (offset,))
+        finally:
+            self.connection.execute('DETACH DATABASE shard')
+
+    def close(self, index=True):
+        self.flush()
+        if index:
+            self.connection.executescript(INDEXES)
+        self.connection.close()
+
+def remove_shard(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query a hand history written by love-letter.py --history')
+    parser.add_argument('database', help='SQLite hand history')
+    parser.add_argument('--query', choices=sorted(QUERIES), help='run a stored query')
+    parser.add_argument('--sql', help='run an SQL statement')
+    parser.add_argument('--card', default='PRINCESS', help='card name for queries that take one')
+    parser.add_argument('--list', action='store_true', help='list the stored queries')
+    args = parser.parse_args()
+
+    if args.list:
+        for (name, (description, sql)) in sorted(QUERIES.items()):
+            print('%-14s %s' % (name, description))
+        sys.exit(0)
+    if (args.query is None) == (args.sql is None):
+        parser.error('Give exactly one of --query or --sql')
+    if args.card.upper() not in Cards.names[1:]:
+        parser.error('Unknown card %s' % args.card)
+    if not os.path.exists(args.database):
+        parser.error('%s does not exist' % args.database)
+
+    connection = sqlite3.connect(args.database)
+    sql = QUERIES[args.query][1] if args.query else args.sql
+    params = {'card': Cards.names.index(args.card.upper())} if ':card' in sql else ()
+    try:
+        cursor = connection.execute(sql, params)
+    except sqlite3.Error as e:
+        parser.error(str(e))
+    print('\t'.join(column[0] for column in cursor.description or ()))
+    for row in cursor:
+        print('\t'.join('' if value is None else str(value) for value in row))
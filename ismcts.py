@@ -0,0 +1,295 @@
+import math, multiprocessing, random, time
+
+from agent import Agent, ai_log
+from card import Cards, CardSet
+from state import GameState, TARGETED
+
+def _counts(bits):
+    return [(bits >> (card * CardSet.BITS)) & CardSet.MASK for card in range(Cards.NUM_CARDS)]
+
+def to_play(action):
+    (player, card, target, challenge) = action
+    play = {'card': card}
+    if target is not None:
+        play['target'] = target
+    if challenge is not None:
+        play['challenge'] = challenge
+    return play
+
+def _targets(state, card):
+    # Targeting a HANDMAIDEN player is wasted unless nobody else is left
+    targets = state.targets(card)
+    open_targets = [i for i in targets if i == state.current or not (state.protected >> i) & 1]
+    return open_targets or targets
+
+def legal_actions(state, supports=None):
+    # Legal plays for the player to move, without discarding the PRINCESS,
+    # wasting a play on a HANDMAIDEN or guessing a card the target cannot hold
+    player = state.current
+    actions = []
+    for (card, target, challenge) in state.legal_plays():
+        if card == Cards.PRINCESS or (target is not None and target not in _targets(state, card)):
+            continue
+        if challenge is not None and supports and supports[target] is not None:
+            if not (supports[target] >> (challenge * CardSet.BITS)) & CardSet.MASK:
+                continue
+        actions.append((player, card, target, challenge))
+
+    if not actions:
+        actions = [(player,) + play for play in state.legal_plays()]
+    return actions
+
+def rollout_action(state, rng):
+    # Default policy: discard the lower card, as LowballAgent does, with a
+    # random target and challenge
+    player = state.current
+    cards = state.cards(player)
+    card = min(cards)
+    if Cards.COUNTESS in cards and (Cards.PRINCE in cards or Cards.KING in cards):
+        card = Cards.COUNTESS
+    if card not in TARGETED:
+        return (player, card, None, None)
+    challenge = rng.randrange(Cards.PRIEST, Cards.NUM_CARDS) if card == Cards.GUARD else None
+    return (player, card, rng.choice(_targets(state, card)), challenge)
+
+class Position:
+    # Picklable snapshot of what the searching player knows, taken from its
+    # observer at a decision point
+    def __init__(self, player, hand, out, handmaiden, supports, pool, deck_size):
+        self.player = player
+        self.hand = hand
+        self.out = out
+        self.handmaiden = handmaiden
+        self.supports = supports
+        self.pool = pool
+        self.deck_size = deck_size
+
+    @staticmethod
+    def from_observer(observer, player, hand):
+        players = observer.players
+        return Position(player, list(hand), [p.out for p in players], [p.handmaiden for p in players],
+            [None if p.number == player or p.out else p.cards.bits for p in players],
+            observer.deck_set.bits, observer.deck_size)
+
+    def state(self, hands, deck):
+        protected = 0
+        for (i, handmaiden) in enumerate(self.handmaiden):
+            if handmaiden:
+                protected |= 1 << i
+        hand = [0 if self.out[i] else self.hand[0] if i == self.player else hands.get(i, 0) for i in range(len(self.out))]
+        return GameState(hand, deck, self.player, self.hand[1], protected)
+
+    def legal_actions(self):
+        hands = dict((i, Cards.GUARD) for i in range(len(self.out)))
+        return legal_actions(self.state(hands, []), self.supports)
+
+    def _deal(self, rng, counts, order):
+        hands = {}
+        for i in order:
+            support = self.supports[i]
+            weights = [count if (support >> (card * CardSet.BITS)) & CardSet.MASK else 0 for (card, count) in enumerate(counts)]
+            total = sum(weights)
+            if total == 0:
+                return None
+            pick = rng.randrange(total)
+            for (card, weight) in enumerate(weights):
+                if pick < weight:
+                    break
+                pick -= weight
+            hands[i] = card
+            counts[card] -= 1
+        return hands
+
+    def determinize(self, rng):
+        # Deal the most constrained opponents first and retry on a dead end;
+        # marginal beliefs can be jointly inconsistent, so fall back to
+        # ignoring them rather than failing the iteration
+        order = [i for (i, support) in enumerate(self.supports) if support is not None]
+        order.sort(key=lambda i: bin(self.supports[i]).count('1'))
+        for attempt in range(8):
+            counts = _counts(self.pool)
+            hands = self._deal(rng, counts, order)
+            if hands is not None:
+                break
+        else:
+            counts = _counts(self.pool)
+            supports = self.supports
+            self.supports = [None if support is None else CardSet.ALL for support in supports]
+            hands = self._deal(rng, counts, order)
+            self.supports = supports
+
+        deck = []
+        for (card, count) in enumerate(counts):
+            deck.extend([card] * count)
+        rng.shuffle(deck)
+        del deck[self.deck_size:]
+
+        return self.state(hands, deck)
+
+class Node:
+    __slots__ = ('player', 'children', 'visits', 'wins', 'available')
+
+    def __init__(self, player):
+        self.player = player
+        self.children = {}
+        self.visits = 0
+        self.wins = 0
+        self.available = 0
+
+def _select(node, actions, exploration, rng):
+    untried = [action for action in actions if action not in node.children]
+    for action in actions:
+        child = node.children.get(action)
+        if child is not None:
+            child.available += 1
+    if untried:
+        action = rng.choice(untried)
+        child = Node(action[0])
+        child.available = 1
+        node.children[action] = child
+        return (action, child, True)
+
+    best = None
+    best_score = -1
+    for action in actions:
+        child = node.children[action]
+        score = child.wins / child.visits + exploration * math.sqrt(math.log(child.available) / child.visits)
+        if score > best_score:
+            (best, best_score) = (action, score)
+    return (best, node.children[best], False)
+
+def search(root, position, iterations=None, time_budget=None, exploration=0.7, rng=random):
+    # Single-observer ISMCTS: each iteration samples a determinization and
+    # walks the shared tree using only the actions legal in that sample
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    count = 0
+    while (iterations is None or count < iterations) and (deadline is None or time.perf_counter() < deadline):
+        count += 1
+        state = position.determinize(rng)
+        node = root
+        path = [node]
+        expanded = False
+        while not state.done and not expanded:
+            if state.current == position.player:
+                # Guard challenges the searcher already knows will miss are
+                # only pruned at the root, where its beliefs are current
+                actions = legal_actions(state, position.supports if node is root else None)
+                (action, node, expanded) = _select(node, actions, exploration, rng)
+            else:
+                # Opponents follow the default policy even inside the tree:
+                # selecting their moves by win rate would let them learn our
+                # hand, which is fixed across determinizations
+                action = rollout_action(state, rng)
+                child = node.children.get(action)
+                if child is None:
+                    child = node.children[action] = Node(action[0])
+                node = child
+            path.append(node)
+            state.step(*action[1:])
+
+        while not state.done:
+            state.step(*rollout_action(state, rng)[1:])
+
+        for node in path:
+            node.visits += 1
+            if node.player == state.winner:
+                node.wins += 1
+
+    return count
+
+def _search_worker(args):
+    (position, iterations, time_budget, exploration, seed) = args
+    root = Node(None)
+    search(root, position, iterations, time_budget, exploration, random.Random(seed))
+    return dict((action, (child.visits, child.wins)) for (action, child) in root.children.items())
+
+class ISMCTSAgent(Agent):
+    def __init__(self, player, names, iterations=300, time_budget=None, workers=1, exploration=0.7):
+        super(ISMCTSAgent, self).__init__(player, names)
+        self.iterations = iterations
+        self.time_budget = time_budget
+        self.workers = workers
+        self.exploration = exploration
+        self.pool = None
+        self.tree = None
+        self.history = []
+        self.action = None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def start_round(self, card):
+        super(ISMCTSAgent, self).start_round(card)
+        self.tree = None
+        self.history = []
+        self.action = None
+
+    def report_event(self, event):
+        super(ISMCTSAgent, self).report_event(event)
+        # The dealer drops the guess of a GUARD on a HANDMAIDEN player, so
+        # the agent's own play is keyed as it was searched
+        action = (event.player, event.card, event.target, event.challenge)
+        if self.action is not None and self.action[:3] == action[:3]:
+            action = self.action
+        self.action = None
+        self.history.append(action)
+
+    def _reuse_tree(self):
+        # Follow the plays made since the last decision down the old tree; the
+        # subtree already holds statistics for this information set
+        node = self.tree
+        for action in self.history:
+            if node is None:
+                break
+            child = node.children.get(action)
+            if child is None and action[1] == Cards.GUARD and action[2] is not None and action[3] is None:
+                # An opponent's unreported guess: every guess on a protected
+                # target reaches the same state, so follow the most explored
+                guesses = [child for (searched, child) in node.children.items() if searched[:3] == action[:3]]
+                child = max(guesses, key=lambda child: child.visits) if guesses else None
+            node = child
+        self.history = []
+        if node is None or node.player == self.player:
+            return Node(None)
+        return node
+
+    def get_play(self):
+        ret = self._get_required_play()
+        if ret:
+            self.tree = None
+            return ret
+
+        position = Position.from_observer(self.observer, self.player, self.cards)
+        root = self._reuse_tree()
+        jobs = None
+        if self.workers > 1:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.workers - 1)
+            args = [(position, self.iterations, self.time_budget, self.exploration, random.getrandbits(64))
+                for i in range(self.workers - 1)]
+            jobs = self.pool.map_async(_search_worker, args)
+
+        search(root, position, self.iterations, self.time_budget, self.exploration)
+
+        stats = dict((action, [child.visits, child.wins]) for (action, child) in root.children.items())
+        if jobs is not None:
+            for result in jobs.get():
+                for (action, (visits, wins)) in result.items():
+                    entry = stats.setdefault(action, [0, 0])
+                    entry[0] += visits
+                    entry[1] += wins
+
+        legal = position.legal_actions()
+        action = max(legal, key=lambda action: stats.get(action, (0, 0))[0])
+        if ai_log.enabled:
+            ai_log.print('%s search results:', self.name)
+            for a in sorted(legal, key=lambda a: stats.get(a, (0, 0))[0], reverse=True):
+                (visits, wins) = stats.get(a, (0, 0))
+                ai_log.print('  %s %s: %i visits, %i%% wins', Cards.name(a[1]), to_play(a), visits, wins * 100 / max(visits, 1))
+
+        self.tree = root
+        self.action = action
+        return to_play(action)
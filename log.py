@@ -1,27 +1,54 @@
+class Zone:
+    __slots__ = ('name', 'enabled', 'stripped')
+
+    def __init__(self, name):
+        self.name = name
+        self.enabled = False
+        self.stripped = False
+
+    def print(self, s, *args):
+        if not self.enabled:
+            return
+
+        if args:
+            s = s % args
+
+        if self.stripped:
+            print(s)
+        else:
+            print('* %s: %s' % (self.name, s))
+
 class Log:
-    enabled_zones = set()
-    enabled_zones_stripped = set()
+    zones = {}
+
+    @staticmethod
+    def zone(name):
+        zone = Log.zones.get(name)
+        if zone is None:
+            zone = Zone(name)
+            Log.zones[name] = zone
+        return zone
 
     @staticmethod
     def print(s):
         if ':' in s:
-            zone = s.split(':')[0]
+            (zone, s) = s.split(':', 1)
+            Log.zone(zone).print(s[1:])
         else:
-            zone = None
+            print('* %s' % s)
 
-        if zone is None or zone in Log.enabled_zones:
-            if zone in Log.enabled_zones_stripped:
-                s = s[len(zone) + 2:]
-                print(s)
-            else:
-                print('* %s' % s)
+    @staticmethod
+    def enabled(zone):
+        return Log.zone(zone).enabled
 
+    @staticmethod
     def enable(zone, stripped=False):
-        Log.enabled_zones.add(zone)
-        if stripped:
-            Log.enabled_zones_stripped.add(zone)
+        zone = Log.zone(zone)
+        zone.enabled = True
+        zone.stripped = zone.stripped or stripped
 
+    @staticmethod
     def disable(zone):
-        Log.enabled_zones.remove(zone)
-        if zone in Log.enabled_zones_stripped:
-            Log.enabled_zones_stripped.remove(zone)
+        zone = Log.zone(zone)
+        zone.enabled = False
+        zone.stripped = False
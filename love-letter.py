@@ -1,33 +1,75 @@
-import random, sys
-import dealer, agent
+import argparse, random, sys
+import dealer, agent, arena
+from card import VARIANTS, use_variant
 
-class Arena:
-    def __init__(self, agents):
-        self.agents = agents
-        self.dealer = dealer.Dealer(agents)
-        self.wins = []
-        for agent in self.agents:
-            self.wins.append(0)
+parser = argparse.ArgumentParser()
+parser.add_argument('--arena', action='store_true', help='run bot-only games instead of an interactive game')
+parser.add_argument('--games', type=int, default=2000, help='number of arena games')
+parser.add_argument('--workers', type=int, default=1, help='number of arena worker processes')
+parser.add_argument('--seed', type=int, default=None, help='master seed for arena games')
+parser.add_argument('--backend', choices=('dealer', 'batch'), default='dealer', help='arena engine; batch runs games in lockstep with NumPy')
+parser.add_argument('--shared-observer', action='store_true', help='track public beliefs once per table instead of once per agent')
+parser.add_argument('--record', metavar='PATH', help='append a binary event log of the arena games to PATH')
+parser.add_argument('--history', metavar='PATH', help='append the arena games to the SQLite hand history at PATH (see history.py)')
+parser.add_argument('--dataset', metavar='DIR', help='append every arena decision to the memory-mapped dataset in DIR (see dataset.py)')
+parser.add_argument('--profile', action='store_true', help='time each dealer phase and print a report after the arena run')
+parser.add_argument('--metrics', metavar='PATH', help='write per-round arena metrics to PATH as CSV (.csv) or JSON and print a summary')
+parser.add_argument('--sandbox', type=float, metavar='SECONDS', help='run each arena agent in its own process with this deadline per move')
+parser.add_argument('--duplicate', action='store_true', help='replay each deal set with every seat rotation; --games counts deal sets')
+parser.add_argument('--variant', choices=sorted(VARIANTS), default='classic', help='deck and table variant')
+parser.add_argument('--lineup', default='endgame,random,lowball,lowball', help='comma-separated arena agent types (%s)' % ', '.join(sorted(arena.AGENT_TYPES)))
+args = parser.parse_args()
+use_variant(args.variant)
 
-    def run_games(self, num_games):
-        for i in range(num_games):
-            winner = self.dealer.do_game()
-            self.wins[winner] += 1
+if args.arena:
+    try:
+        lineup = arena.parse_lineup(args.lineup)
+    except ValueError as e:
+        parser.error(str(e))
 
-        return self.wins
+    seed = args.seed
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    print('Seed: %i' % seed)
 
-
-if len(sys.argv) > 1 and sys.argv[1] == '--arena':
-    names = ['Alice', 'Bob', 'Charlie', 'Dave']
-    agents = [agent.EndgameAgent(0, names), agent.RandomAgent(1, names), agent.LowballAgent(2, names), agent.LowballAgent(3, names)]
-    arena = Arena(agents)
-
-    num_games = 2000
-    wins = arena.run_games(num_games)
+    num_games = args.games
+    errors = None
+    if args.sandbox is not None and (args.duplicate or args.backend == 'batch' or args.shared_observer):
+        parser.error('--sandbox cannot be combined with --duplicate, --backend batch or --shared-observer')
+    if args.duplicate:
+        if args.backend == 'batch' or args.record or args.profile or args.metrics or args.history or args.dataset:
+            parser.error('--duplicate cannot be combined with --backend batch, --record, --profile, --metrics, --history or --dataset')
+        parallel_arena = arena.DuplicateArena(lineup, seed, args.workers, args.shared_observer)
+        wins = parallel_arena.run_games(num_games)
+        errors = parallel_arena.standard_errors()
+        num_games *= len(lineup)
+    elif args.backend == 'batch':
+        if args.metrics or args.history or args.dataset:
+            parser.error('--metrics, --history and --dataset cannot be combined with --backend batch')
+        import batch
+        for kind in lineup:
+            if kind not in batch.POLICY_TYPES:
+                parser.error('Agent type %s is not supported by the batch backend' % kind)
+        wins = batch.run_batch(lineup, num_games, seed)
+    else:
+        parallel_arena = arena.ParallelArena(lineup, seed, args.workers, args.shared_observer, args.record, args.profile, args.sandbox,
+            args.metrics is not None, args.history, args.dataset)
+        wins = parallel_arena.run_games(num_games)
+        if args.metrics:
+            parallel_arena.metrics.write(args.metrics)
+            parallel_arena.metrics.report()
+        if args.sandbox is not None:
+            print('Penalties: %s  Respawns: %s' % (parallel_arena.penalties, parallel_arena.respawns))
     print('Final statistics:')
-    for i in range(len(agents)):
-        print('%s (%s): %i (%i%%)' % (agents[i].name, agents[i].__class__.__name__, wins[i], wins[i] * 100 / num_games))
+    for i in range(len(lineup)):
+        if errors:
+            print('%s (%s): %i (%.1f%% +/- %.1f%%)' % (arena.NAMES[i], arena.AGENT_TYPES[lineup[i]].__name__, wins[i], wins[i] * 100 / num_games, errors[i] * 100))
+        else:
+            print('%s (%s): %i (%i%%)' % (arena.NAMES[i], arena.AGENT_TYPES[lineup[i]].__name__, wins[i], wins[i] * 100 / num_games))
 else:
+    variant = VARIANTS[args.variant]
+    if 4 not in range(variant.min_players, variant.max_players + 1):
+        parser.error('The %s variant does not seat 4 players' % args.variant)
     print('Enter your name: ', end='')
     sys.stdout.flush()
     name = sys.stdin.readline().strip()
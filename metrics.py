@@ -0,0 +1,163 @@
+import csv, json
+
+from card import Cards
+from dealer import Listener
+
+class Histogram:
+    # Round and game lengths are small integers, so a count per distinct
+    # value is an exact quantile sketch whose size does not grow with the
+    # number of samples
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.sum = 0
+
+    def add(self, value):
+        self.counts[value] = self.counts.get(value, 0) + 1
+        self.total += 1
+        self.sum += value
+
+    def merge(self, other):
+        for (value, count) in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+    def quantile(self, fraction):
+        if not self.total:
+            return None
+        rank = fraction * (self.total - 1)
+        seen = 0
+        for value in sorted(self.counts):
+            seen += self.counts[value]
+            if seen > rank:
+                return value
+
+    def summary(self):
+        ret = {'count': self.total, 'mean': self.mean()}
+        for (label, fraction) in (('min', 0), ('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1)):
+            ret[label] = self.quantile(fraction)
+        return ret
+
+def _eliminator(event):
+    # The card whose play knocked a player out, if any
+    card = event.card
+    if card == Cards.GUARD and event.discard:
+        return card
+    elif card == Cards.BARON and event.loser is not None:
+        return card
+    elif card == Cards.PRINCE and event.discard == Cards.PRINCESS:
+        return card
+    elif card == Cards.PRINCESS:
+        return card
+    return None
+
+class Metrics(Listener):
+    # Streaming per-round statistics. Everything is a counter or a Histogram,
+    # so memory stays constant however many games are played, and results
+    # from several workers combine with merge.
+    def __init__(self):
+        self.classes = []
+        self.games = 0
+        self.rounds = 0
+        self.ties = 0
+        self.round_length = Histogram()
+        self.game_length = Histogram()
+        self.eliminations = [0 for card in range(Cards.NUM_CARDS)]
+        self.plays = {}
+        self.turns = 0
+        self.game_rounds = 0
+
+    def attach(self, dealer):
+        self.classes = [getattr(agent, 'agent_class', type(agent)).__name__ for agent in dealer.agents]
+        for name in self.classes:
+            self.plays.setdefault(name, [0 for card in range(Cards.NUM_CARDS)])
+        dealer.add_listener(self)
+
+    def start_game(self):
+        self.game_rounds = 0
+
+    def start_round(self, start_player):
+        self.turns = 0
+
+    def report_play(self, event, player_event, target_event):
+        self.turns += 1
+        self.plays[self.classes[event.player]][event.card] += 1
+        card = _eliminator(event)
+        if card is not None:
+            self.eliminations[card] += 1
+
+    def end_round(self, cards, winner):
+        self.rounds += 1
+        self.game_rounds += 1
+        if winner is None:
+            self.ties += 1
+        self.round_length.add(self.turns)
+
+    def end_game(self, winner):
+        self.games += 1
+        self.game_length.add(self.game_rounds)
+
+    def merge(self, other):
+        self.games += other.games
+        self.rounds += other.rounds
+        self.ties += other.ties
+        self.round_length.merge(other.round_length)
+        self.game_length.merge(other.game_length)
+        for card in range(Cards.NUM_CARDS):
+            self.eliminations[card] += other.eliminations[card]
+        for (name, counts) in other.plays.items():
+            mine = self.plays.setdefault(name, [0 for card in range(Cards.NUM_CARDS)])
+            for card in range(Cards.NUM_CARDS):
+                mine[card] += counts[card]
+
+    def to_dict(self):
+        return {
+            'games': self.games,
+            'rounds': self.rounds,
+            'tie_rate': self.ties / self.rounds if self.rounds else 0,
+            'round_length': self.round_length.summary(),
+            'game_length': self.game_length.summary(),
+            'eliminations': {Cards.name(card): self.eliminations[card] for card in range(Cards.GUARD, Cards.NUM_CARDS)},
+            'plays': {name: {Cards.name(card): counts[card] for card in range(Cards.GUARD, Cards.NUM_CARDS)}
+                for (name, counts) in sorted(self.plays.items())}
+            }
+
+    def rows(self):
+        data = self.to_dict()
+        yield ('games', '', data['games'])
+        yield ('rounds', '', data['rounds'])
+        yield ('tie_rate', '', data['tie_rate'])
+        for metric in ('round_length', 'game_length'):
+            for (key, value) in data[metric].items():
+                yield (metric, key, value)
+        for (card, count) in data['eliminations'].items():
+            yield ('eliminations', card, count)
+        for (name, counts) in data['plays'].items():
+            for (card, count) in counts.items():
+                yield ('plays', '%s/%s' % (name, card), count)
+
+    def write(self, path):
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.csv'):
+                writer = csv.writer(f)
+                writer.writerow(('metric', 'key', 'value'))
+                writer.writerows(self.rows())
+            else:
+                json.dump(self.to_dict(), f, indent=2)
+                f.write('\n')
+
+    def report(self):
+        data = self.to_dict()
+        print('Metrics: %i games, %i rounds, %.1f%% tied rounds' % (data['games'], data['rounds'], data['tie_rate'] * 100))
+        for metric in ('round_length', 'game_length'):
+            summary = data[metric]
+            print('  %-12s mean %.2f  p50 %s  p90 %s  p99 %s  max %s' % (metric, summary['mean'], summary['p50'], summary['p90'],
+                summary['p99'], summary['max']))
+        print('  eliminations %s' % '  '.join('%s:%i' % item for item in data['eliminations'].items() if item[1]))
+        for (name, counts) in data['plays'].items():
+            total = sum(counts.values()) or 1
+            print('  %-12s %s' % (name, '  '.join('%s:%.1f%%' % (card, count * 100 / total) for (card, count) in counts.items())))
@@ -1,16 +1,18 @@
 from card import Cards, CardSet
-from log import Log
+from log import Log, Zone
+from event import PlayEvent
 
 class Player:
     def __init__(self, number, name):
         self.number = number
         self.name = name
+        self.cards = CardSet()
 
     def start_game(self):
         self.score = 0
 
     def start_round(self):
-        self.cards = CardSet.full()
+        self.cards.reset()
         self.next_card = None
         self.out = False
         self.handmaiden = False
@@ -21,7 +23,9 @@ class Player:
 class Observer:
     def __init__(self, names):
         self.players = [Player(i, name) for (i, name) in enumerate(names)]
-        self.saw_draw = {}
+        self.deck_set = CardSet()
+        self.public_set = CardSet()
+        self.saw_draw = set()
 
     def _reveal(self, card, exclude_player=None):
         self.deck_set.remove(card)
@@ -29,20 +33,26 @@ class Observer:
             if player != exclude_player:
                 player.cards.remove(card)
 
+    def _discard(self, card):
+        self._reveal(card)
+        self.public_set.remove(card)
+
     def start_game(self):
         for player in self.players:
             player.start_game()
 
-    def start_round(self, player, card):
-        self.deck_set = CardSet.full()
-        self.deck_size = Cards.DECK_SIZE - len(self.players)
-        self.saw_draw = set()
+    def start_round(self, player=None, card=None):
+        self.deck_set.reset()
+        self.public_set.reset()
+        self.deck_size = Cards.DECK_SIZE - Cards.BURN - len(self.players)
+        self.saw_draw.clear()
 
         for p in self.players:
             p.start_round()
-        player = self.players[player]
-        self._reveal(card, player)
-        player.cards.clear(card)
+        if player is not None:
+            player = self.players[player]
+            self._reveal(card, player)
+            player.cards.clear(card)
 
     def report_draw(self, player, card=None):
         player = self.players[player]
@@ -54,12 +64,15 @@ class Observer:
             self.deck_size -= 1
 
     def report_play(self, *k, **kw):
-        player = self.players[kw['player']]
-        card = kw['card']
-        target = kw.get('target', None)
+        self.report_event(PlayEvent.from_kwargs(kw))
+
+    def report_event(self, event):
+        player = self.players[event.player]
+        card = event.card
+        target = event.target
         if target is not None:
             target = self.players[target]
-        discard = kw.get('discard', None)
+        discard = event.discard
 
         if player.next_card is None:
             player.next_card = CardSet(self.deck_set)
@@ -74,41 +87,42 @@ class Observer:
             self.saw_draw.remove(player)
         else:
             self._reveal(card)
+        self.public_set.remove(card)
 
         if target and not target.handmaiden:
             if card == Cards.GUARD:
-                challenge = kw['challenge']
+                challenge = event.challenge
                 if discard:
-                    self._reveal(discard)
+                    self._discard(discard)
                     target.cards.clear()
                     target.out = True
                 else:
                     target.cards[challenge] = 0
             elif card == Cards.PRIEST:
-                if 'other_card' in kw:
-                    target.cards.clear(kw['other_card'])
+                if event.other_card is not None:
+                    target.cards.clear(event.other_card)
             elif card == Cards.BARON:
-                loser = kw.get('loser', None)
+                loser = event.loser
                 if loser is not None:
                     loser = self.players[loser]
                     winner = player if target == loser else target
-                    self._reveal(discard)
+                    self._discard(discard)
                     loser.cards.clear()
                     loser.out = True
-                    other_card = kw.get('other_card', None)
+                    other_card = event.other_card
                     if other_card:
                         winner.cards.clear(exclude=other_card)
                     else:
                         winner.cards.clear(cards=range(Cards.GUARD, discard + 1))
             elif card == Cards.PRINCE:
-                self._reveal(discard)
+                self._discard(discard)
                 if discard == Cards.PRINCESS:
                     target.out = True
                 else:
                     self.deck_size -= 1
                     target.cards = CardSet(self.deck_set)
-                    if 'new_card' in kw:
-                        target.cards.clear(kw['new_card'])
+                    if event.new_card is not None:
+                        target.cards.clear(event.new_card)
             elif card == Cards.KING:
                 player.cards, target.cards = target.cards, player.cards
 
@@ -127,8 +141,273 @@ class Observer:
             self.players[winner].score += 1
 
     def print_state(self, zone, exclude_player):
-        Log.print('%s: Player scores: %s' % (zone, '  '.join(['%s: %i' % (player, player.score) for player in self.players])))
-        Log.print('%s: Deck set: %s' % (zone, self.deck_set))
+        if not isinstance(zone, Zone):
+            zone = Log.zone(zone)
+        if not zone.enabled:
+            return
+
+        zone.print('Player scores: %s', '  '.join(['%s: %i' % (player, player.score) for player in self.players]))
+        zone.print('Deck set: %s', self.deck_set)
         for player in self.players:
             if not player.out and player.number != exclude_player:
-                Log.print('%s: %s set: %s' % (zone, player, player.cards))
+                zone.print('%s set: %s', player, player.cards)
+
+def _count(bits, card):
+    return (bits >> (card * CardSet.BITS)) & CardSet.MASK
+
+def _card_set(bits):
+    card_set = CardSet()
+    for card in range(Cards.NUM_CARDS):
+        card_set[card] = _count(bits, card)
+    return card_set
+
+class TableObserver(Observer):
+    # The public Observer behind SharedObserver. It keeps the bits of its
+    # sets from just before the latest event, so each view can copy a set at
+    # the state its own Observer would have seen.
+    def __init__(self, names):
+        super(TableObserver, self).__init__(names)
+        self.before = []
+
+    def report_event(self, event):
+        before = [player.cards.bits for player in self.players]
+        before.append(self.deck_set.bits)
+        self.before = before
+        super(TableObserver, self).report_event(event)
+
+class SharedPlayer:
+    __slots__ = ('view', 'public', 'number', 'name', 'card_set')
+
+    def __init__(self, view, public):
+        self.view = view
+        self.public = public
+        self.number = public.number
+        self.name = public.name
+        self.card_set = None
+
+    @property
+    def score(self):
+        return self.public.score
+
+    @property
+    def out(self):
+        return self.public.out
+
+    @property
+    def handmaiden(self):
+        return self.public.handmaiden
+
+    @property
+    def cards(self):
+        # Built on first use after each change and kept until the next
+        card_set = self.card_set
+        if card_set is None:
+            card_set = self.card_set = self.view._cards(self.number)
+        return card_set
+
+    def __str__(self):
+        return self.name
+
+class SharedObserver:
+    # Per-agent view onto a TableObserver that the dealer updates once per
+    # event. It holds the same beliefs as a per-agent Observer. A seat, or
+    # the deck at index len(players), is either the table's set less the
+    # cards in hidden[k], or an explicit set in sets[k]. It becomes
+    # explicit only when this agent's Observer would change it in a way the
+    # table does not.
+    def __init__(self, table, agent):
+        self.table = table
+        self.agent = agent
+        self.player = agent.player
+        self.players = [SharedPlayer(self, player) for player in table.players]
+        self.deck = len(self.players)
+        self.hidden = [[] for k in range(self.deck + 1)]
+        self.sets = [None for k in range(self.deck + 1)]
+        self.deck_cache = None
+        self.next_card = None
+        self.drawn = False
+
+    def _table_set(self, k):
+        return self.table.deck_set if k == self.deck else self.table.players[k].cards
+
+    def _view(self, k, base):
+        card_set = CardSet(base)
+        for card in self.hidden[k]:
+            card_set.remove(card)
+        return card_set
+
+    def _cards(self, k):
+        card_set = self.sets[k]
+        if card_set is None:
+            card_set = self._view(k, self._table_set(k))
+        return card_set
+
+    @property
+    def deck_set(self):
+        if self.deck_cache is None:
+            self.deck_cache = self._cards(self.deck)
+        return self.deck_cache
+
+    @property
+    def public_set(self):
+        return self.table.public_set
+
+    @property
+    def deck_size(self):
+        return self.table.deck_size - self.drawn
+
+    def _explicit(self, k, base):
+        # base is the table's set for k at the point the two part ways
+        if self.sets[k] is None:
+            self.sets[k] = self._view(k, base)
+            self.hidden[k] = None
+        return self.sets[k]
+
+    def _copy(self, k, source, base):
+        # Where the table copied the same set, keep sharing it
+        if self.sets[source] is not None:
+            (self.sets[k], self.hidden[k]) = (CardSet(self.sets[source]), None)
+        elif base is None:
+            (self.sets[k], self.hidden[k]) = (None, list(self.hidden[source]))
+        else:
+            (self.sets[k], self.hidden[k]) = (self._view(source, base), None)
+
+    def _remove(self, card):
+        # Removed by this agent and the table alike, which only touches the
+        # explicit sets
+        for card_set in self.sets:
+            if card_set is not None:
+                card_set.remove(card)
+
+    def _clear(self, k, exclude=None, cards=None):
+        if self.sets[k] is not None:
+            self.sets[k].clear(exclude, cards)
+
+    def _refresh(self):
+        for player in self.players:
+            player.card_set = None
+        self.deck_cache = None
+
+    def start_game(self):
+        pass
+
+    def start_round(self, player, card):
+        # Every other set hides the start card; this agent's own holds the
+        # full deck's count of it
+        self.hidden = [[card] for k in range(self.deck + 1)]
+        self.sets = [None for k in range(self.deck + 1)]
+        own = self.sets[self.player] = CardSet()
+        own[card] = self.table.players[self.player].cards[card]
+        self.hidden[self.player] = None
+        self.next_card = None
+        self.drawn = False
+        self._refresh()
+
+    def report_draw(self, player, card=None):
+        # The deck's count of the drawn card, and nothing else
+        self.next_card = CardSet()
+        deck_set = self.sets[self.deck]
+        if deck_set is None:
+            self.next_card[card] = max(0, self.table.deck_set[card] - self.hidden[self.deck].count(card))
+        else:
+            self.next_card[card] = deck_set[card]
+        for (card_set, hidden) in zip(self.sets, self.hidden):
+            if card_set is None:
+                hidden.append(card)
+            else:
+                card_set.remove(card)
+        self.drawn = True
+        self._refresh()
+
+    def report_play(self, *k, **kw):
+        self.report_event(PlayEvent.from_kwargs(kw))
+
+    def report_event(self, event):
+        # Follows Observer.report_event step by step; the table has already
+        # applied the public event
+        before = self.table.before
+        deck = self.deck
+        player = event.player
+        card = event.card
+        target = event.target
+        discard = event.discard
+
+        held = self.sets[player]
+        table_held = _count(before[player], card)
+        if held is None:
+            held = table_held > self.hidden[player].count(card)
+        else:
+            held = held.contains(card)
+        if held:
+            if player == self.player:
+                (self.sets[player], self.hidden[player]) = (self.next_card, None)
+            elif table_held:
+                self._copy(player, deck, None)
+            else:
+                self._copy(player, deck, _card_set(before[deck]))
+        elif table_held and self.sets[player] is None:
+            self._explicit(player, _card_set(before[player]))
+
+        if player == self.player:
+            # This agent removed the card when it came to hand and the table
+            # removes it now; a set that does not hide it keeps its count
+            self.drawn = False
+            sets = self.sets
+            hidden = self.hidden
+            for k in range(deck + 1):
+                if sets[k] is None:
+                    if card in hidden[k]:
+                        hidden[k].remove(card)
+                    else:
+                        bits = before[deck] if k == player and table_held else before[k]
+                        if _count(bits, card) > 0:
+                            self._explicit(k, _card_set(bits))
+        else:
+            self._remove(card)
+
+        if target is not None and not self.table.players[target].handmaiden:
+            if card == Cards.GUARD:
+                if discard:
+                    self._remove(discard)
+                    self._clear(target)
+                else:
+                    self._clear(target, cards=(event.challenge,))
+            elif card == Cards.PRIEST:
+                if event.other_card is not None:
+                    self._explicit(target, self._table_set(target)).clear(event.other_card)
+            elif card == Cards.BARON:
+                loser = event.loser
+                if loser is not None:
+                    winner = player if target == loser else target
+                    self._remove(discard)
+                    self._clear(loser)
+                    other_card = event.other_card
+                    if other_card:
+                        # The table's clear below discard leaves this count be
+                        self._explicit(winner, self._table_set(winner)).clear(exclude=other_card)
+                    else:
+                        self._clear(winner, cards=range(Cards.GUARD, discard + 1))
+            elif card == Cards.PRINCE:
+                self._remove(discard)
+                if discard != Cards.PRINCESS:
+                    self._copy(target, deck, None)
+                    if event.new_card is not None:
+                        self._explicit(target, self._table_set(target)).clear(event.new_card)
+            elif card == Cards.KING:
+                sets = self.sets
+                hidden = self.hidden
+                (sets[player], sets[target]) = (sets[target], sets[player])
+                (hidden[player], hidden[target]) = (hidden[target], hidden[player])
+
+        if card == Cards.COUNTESS:
+            self._clear(player, cards=range(Cards.GUARD, Cards.PRINCE))
+        elif card == Cards.PRINCESS:
+            self._clear(player)
+
+        self.next_card = None
+        self._refresh()
+
+    def end_round(self, cards, winner):
+        pass
+
+    print_state = Observer.print_state
@@ -0,0 +1,68 @@
+import time
+
+from card import Cards
+
+def _card_key(play, player):
+    card = play.get('card', None) if isinstance(play, dict) else None
+    if card in range(Cards.GUARD, Cards.NUM_CARDS):
+        return Cards.name(card)
+    return 'INVALID'
+
+class Profiler:
+    # Wraps dealer, deck and agent methods on the instances it is attached
+    # to, so dealers without a profiler run the unmodified code.
+    def __init__(self):
+        self.stats = {}
+
+    def _wrap(self, fn, phase, key=None, key_fn=None):
+        stats = self.stats
+        clock = time.perf_counter_ns
+
+        def timed(*k, **kw):
+            start = clock()
+            ret = fn(*k, **kw)
+            elapsed = clock() - start
+            name = (phase, key if key_fn is None else key_fn(*k, **kw))
+            entry = stats.get(name)
+            if entry is None:
+                stats[name] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+            return ret
+
+        return timed
+
+    def attach(self, dealer):
+        dealer.do_game = self._wrap(dealer.do_game, 'game')
+        dealer.do_round = self._wrap(dealer.do_round, 'round')
+        dealer.deck.reset = self._wrap(dealer.deck.reset, 'deck.reset')
+        dealer._validate_play = self._wrap(dealer._validate_play, 'validate', key_fn=_card_key)
+        dealer._apply_play = self._wrap(dealer._apply_play, 'process', key_fn=_card_key)
+        dealer._report_play = self._wrap(dealer._report_play, 'narrate')
+        if dealer.table is not None:
+            dealer.table.report_event = self._wrap(dealer.table.report_event, 'table.report_event')
+
+        for agent in dealer.agents:
+            name = agent.__class__.__name__
+            agent.start_round = self._wrap(agent.start_round, 'start_round', name)
+            agent.report_draw = self._wrap(agent.report_draw, 'report_draw', name)
+            agent.get_play = self._wrap(agent.get_play, 'get_play', name)
+            agent.report_event = self._wrap(agent.report_event, 'report_event', name)
+
+    def merge(self, stats):
+        for (name, (count, total)) in stats.items():
+            entry = self.stats.get(name)
+            if entry is None:
+                self.stats[name] = [count, total]
+            else:
+                entry[0] += count
+                entry[1] += total
+
+    def report(self):
+        round_time = sum(total for ((phase, key), (count, total)) in self.stats.items() if phase == 'round')
+        print('Profile:')
+        print('  %-18s %-16s %10s %12s %10s %7s' % ('phase', 'key', 'calls', 'total ms', 'mean us', 'round%'))
+        for ((phase, key), (count, total)) in sorted(self.stats.items(), key=lambda x: x[1][1], reverse=True):
+            share = total * 100 / round_time if round_time else 0
+            print('  %-18s %-16s %10i %12.1f %10.2f %6.1f%%' % (phase, key or '', count, total / 1e6, total / count / 1e3, share))
@@ -0,0 +1,187 @@
+import mmap, os, shutil, struct
+
+from dealer import Listener
+from event import PlayEvent
+
+MAGIC = b'LLEV'
+VERSION = 1
+HEADER = struct.Struct('<4sBB10x')
+RECORD = struct.Struct('<12B')
+NONE = 0xff
+
+GAME_START = 1
+ROUND_START = 2
+DEAL = 3
+DRAW = 4
+PLAY = 5
+ROUND_END = 6
+GAME_END = 7
+
+MAX_PLAYERS = RECORD.size - 2
+
+def _field(value):
+    return NONE if value is None else value
+
+def _value(field):
+    return None if field == NONE else field
+
+class Recorder(Listener):
+    def __init__(self, stream, num_players, buffer_records=4096):
+        if num_players > MAX_PLAYERS:
+            raise ValueError('Cannot record more than %i players' % MAX_PLAYERS)
+        self.stream = stream
+        self.num_players = num_players
+        self.buffer = bytearray()
+        self.buffer_size = buffer_records * RECORD.size
+
+    @staticmethod
+    def open(path, num_players):
+        stream = open(path, 'ab')
+        if stream.tell() == 0:
+            stream.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        return Recorder(stream, num_players)
+
+    @staticmethod
+    def open_shard(path, num_players):
+        # Bare records without a header, for merge to append to a log
+        return Recorder(open(path, 'wb'), num_players)
+
+    def _write(self, *fields):
+        self.buffer += RECORD.pack(*fields, *[NONE] * (RECORD.size - len(fields)))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.stream.write(self.buffer)
+        self.buffer.clear()
+
+    def merge(self, shard):
+        self.flush()
+        with open(shard, 'rb') as f:
+            shutil.copyfileobj(f, self.stream)
+
+    def close(self):
+        self.flush()
+        self.stream.close()
+
+    def start_game(self):
+        self._write(GAME_START, self.num_players)
+
+    def start_round(self, start_player):
+        self._write(ROUND_START, start_player)
+
+    def report_deal(self, player, card):
+        self._write(DEAL, player, card)
+
+    def report_draw(self, player, card):
+        self._write(DRAW, player, card)
+
+    def report_play(self, event, player_event, target_event):
+        self._write(PLAY, event.player, event.card, _field(event.target), _field(event.challenge),
+            _field(event.discard), _field(event.loser), _field(player_event.other_card),
+            _field(target_event.other_card), _field(target_event.new_card))
+
+    def end_round(self, cards, winner):
+        self._write(ROUND_END, _field(winner), *[_field(card) for card in cards])
+
+    def end_game(self, winner):
+        self._write(GAME_END, winner)
+        self.flush()
+
+def remove_shard(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+class ObserverSeat:
+    def __init__(self, player, observer):
+        self.player = player
+        self.observer = observer
+
+    def start_game(self):
+        self.observer.start_game()
+
+    def start_round(self, card):
+        self.observer.start_round(self.player, card)
+
+    def report_draw(self, card):
+        self.observer.report_draw(self.player, card)
+
+    def report_event(self, event):
+        self.observer.report_event(event)
+
+    def end_round(self, cards, winner):
+        self.observer.end_round(cards, winner)
+
+    def end_game(self, winner):
+        pass
+
+class Replayer:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            raise ValueError('%s is not a game event log' % path)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, record_size) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError('%s is not a version %i game event log' % (path, VERSION))
+        self.end = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *k):
+        self.close()
+
+    def __len__(self):
+        return (self.end - HEADER.size) // RECORD.size
+
+    def records(self):
+        return RECORD.iter_unpack(memoryview(self.map)[HEADER.size:self.end])
+
+    def replay(self, agents):
+        games = 0
+        num_players = len(agents)
+        for record in self.records():
+            kind = record[0]
+            if kind == PLAY:
+                (player, card, target, challenge, discard, loser, player_other, target_other, new_card) = [_value(field) for field in record[1:10]]
+                event = PlayEvent(player, card, target, challenge, discard, loser)
+                player_event = target_event = event
+                if player_other is not None:
+                    player_event = event.private(other_card=player_other)
+                if target_other is not None or new_card is not None:
+                    target_event = event.private(other_card=target_other, new_card=new_card)
+                    if target == player:
+                        player_event = target_event
+
+                for (i, agent) in enumerate(agents):
+                    if i == player:
+                        agent.report_event(player_event)
+                    elif i == target:
+                        agent.report_event(target_event)
+                    else:
+                        agent.report_event(event)
+            elif kind == DRAW:
+                agents[record[1]].report_draw(record[2])
+            elif kind == DEAL:
+                agents[record[1]].start_round(record[2])
+            elif kind == ROUND_END:
+                cards = [_value(card) for card in record[2:2 + num_players]]
+                for agent in agents:
+                    agent.end_round(cards, _value(record[1]))
+            elif kind == GAME_START:
+                if record[1] != num_players:
+                    raise ValueError('Recorded game has %i players, got %i agents' % (record[1], num_players))
+                for agent in agents:
+                    agent.start_game()
+            elif kind == GAME_END:
+                for agent in agents:
+                    agent.end_game(record[1])
+                games += 1
+
+        return games
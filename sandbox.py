@@ -0,0 +1,148 @@
+import multiprocessing, random
+
+from event import PlayEvent
+
+# Notifications are buffered in the dealer process and shipped as one batch
+# with the next move request, so a round costs one round trip per decision
+START_GAME = 0
+START_ROUND = 1
+DRAW = 2
+EVENT = 3
+END_ROUND = 4
+END_GAME = 5
+PLAY = 6
+
+def _worker(conn, agent_class, player, names):
+    agent = agent_class(player, names)
+    while True:
+        try:
+            batch = conn.recv()
+        except EOFError:
+            break
+        for message in batch:
+            kind = message[0]
+            if kind == EVENT:
+                agent.report_event(PlayEvent(*message[1:]))
+            elif kind == DRAW:
+                agent.report_draw(message[1])
+            elif kind == START_ROUND:
+                agent.start_round(message[1])
+            elif kind == END_ROUND:
+                agent.end_round(message[1], message[2])
+            elif kind == START_GAME:
+                seed = message[1]
+                agent.start_game()
+            elif kind == END_GAME:
+                agent.end_game(message[1])
+            elif kind == PLAY:
+                # Each decision draws from its own stream, so a respawned
+                # worker makes the same draws the old one would have
+                random.seed('%i:%i' % (seed, message[1]))
+                play = agent.get_play()
+                conn.send((play.get('card'), play.get('target'), play.get('challenge')) if isinstance(play, dict) else None)
+
+class SandboxAgent:
+    # Stands in for an agent running in its own process. A move that misses
+    # the deadline, or a worker that dies, forfeits the move; the worker is
+    # then killed and a fresh one is brought up to date by replaying the
+    # notifications of the current game. The worker's RNG is reseeded from
+    # the game seed and the decision number before every move; state an
+    # agent builds inside get_play, such as a search tree, is not replayed.
+    def __init__(self, agent_class, player, names, deadline=1.0):
+        self.agent_class = agent_class
+        self.player = player
+        self.name = names[player]
+        self.names = names
+        self.deadline = deadline
+        self.batch = []
+        self.history = []
+        self.decisions = 0
+        self.timeouts = 0
+        self.respawns = 0
+        self.process = None
+        self._spawn()
+
+    def __str__(self):
+        return self.name
+
+    def _spawn(self):
+        (self.conn, child) = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker, args=(child, self.agent_class, self.player, self.names), daemon=True)
+        self.process.start()
+        child.close()
+
+    def _kill(self):
+        self.conn.close()
+        self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+    def _respawn(self):
+        self._kill()
+        self.respawns += 1
+        self._spawn()
+        if self.history:
+            self.conn.send(self.history)
+
+    def close(self):
+        if self.process is not None:
+            self._kill()
+            self.process = None
+
+    def _notify(self, message):
+        self.batch.append(message)
+        self.history.append(message)
+
+    def start_game(self):
+        self.history = []
+        self.decisions = 0
+        self._notify((START_GAME, random.getrandbits(64)))
+
+    def start_round(self, card):
+        self._notify((START_ROUND, card))
+
+    def report_draw(self, card):
+        self._notify((DRAW, card))
+
+    def report_event(self, event):
+        self._notify((EVENT, event.player, event.card, event.target, event.challenge, event.discard,
+            event.loser, event.other_card, event.new_card))
+
+    def end_round(self, cards, winner):
+        self._notify((END_ROUND, cards, winner))
+
+    def end_game(self, winner):
+        self._notify((END_GAME, winner))
+        self._flush()
+
+    def _flush(self):
+        try:
+            self.conn.send(self.batch)
+        except (OSError, ValueError):
+            self._respawn()
+        self.batch = []
+
+    def get_play(self):
+        self.batch.append((PLAY, self.decisions))
+        self.decisions += 1
+        self._flush()
+        try:
+            if self.conn.poll(self.deadline):
+                reply = self.conn.recv()
+                if reply is not None:
+                    (card, target, challenge) = reply
+                    play = {'card': card}
+                    if target is not None:
+                        play['target'] = target
+                    if challenge is not None:
+                        play['challenge'] = challenge
+                    return play
+                return {}
+            self.timeouts += 1
+        except (EOFError, OSError):
+            pass
+
+        self._respawn()
+        return None
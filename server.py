@@ -0,0 +1,280 @@
+import argparse, asyncio, json, random
+
+import arena
+from dealer import HeadlessDealer
+from agent import Agent
+from card import Cards, VARIANTS, use_variant
+
+# Bots that search for their moves run in a thread so the event loop keeps
+# serving the other tables while they think
+OFFLOAD_TYPES = ('ismcts', 'solver')
+
+def send(writer, message):
+    writer.write(json.dumps(message).encode() + b'\n')
+
+class AsyncDealer(HeadlessDealer):
+    def __init__(self, agents, offload=()):
+        super(AsyncDealer, self).__init__(agents)
+        self.offload = offload
+
+    async def _get_play(self, player):
+        agent = self.agents[player]
+        if hasattr(agent, 'get_play_async'):
+            return await agent.get_play_async()
+        if player in self.offload:
+            return await asyncio.get_running_loop().run_in_executor(None, agent.get_play)
+        # Let other tables run between bot moves
+        await asyncio.sleep(0)
+        return agent.get_play()
+
+    async def do_round(self, start_player):
+        rounds = self._round(start_player)
+        try:
+            player = next(rounds)
+            while True:
+                player = rounds.send(await self._get_play(player))
+        except StopIteration as e:
+            return e.value
+
+    async def do_game(self):
+        self._start_game()
+        start_player = 0
+        winner = None
+        while True:
+            winner = await self.do_round(start_player)
+            if winner is not None:
+                start_player = winner
+                if self.agent_info[winner].score == 4:
+                    break
+
+        self._end_game(winner)
+        return winner
+
+class RemoteAgent(Agent):
+    # Seat played by a client over the line protocol. The base class tracks
+    # the hand and table state so bad plays are refused before the dealer
+    # sees them; a client that disconnects or times out is played for.
+    # Turns are numbered and replies may echo the number as 'id'.
+    def __init__(self, player, names, reader, writer, timeout=None):
+        super(RemoteAgent, self).__init__(player, names)
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.connected = True
+        self.turns = 0
+
+    def _send(self, message):
+        if self.connected:
+            send(self.writer, message)
+
+    def start_game(self):
+        super(RemoteAgent, self).start_game()
+        self._send({'type': 'start_game'})
+
+    def start_round(self, card):
+        super(RemoteAgent, self).start_round(card)
+        self._send({'type': 'start_round', 'card': card})
+
+    def report_draw(self, card):
+        super(RemoteAgent, self).report_draw(card)
+        self._send({'type': 'draw', 'card': card})
+
+    def report_event(self, event):
+        super(RemoteAgent, self).report_event(event)
+        message = event.kwargs()
+        message['type'] = 'play'
+        self._send(message)
+
+    def end_round(self, cards, winner):
+        super(RemoteAgent, self).end_round(cards, winner)
+        self._send({'type': 'end_round', 'cards': cards, 'winner': winner})
+
+    def end_game(self, winner):
+        super(RemoteAgent, self).end_game(winner)
+        self._send({'type': 'end_game', 'winner': winner})
+
+    def _targets(self, card):
+        return [player.number for player in self.observer.players
+            if not player.out and (player.number != self.player or card == Cards.PRINCE)]
+
+    def _check(self, play):
+        if not isinstance(play, dict) or play.get('card') not in self.cards:
+            return 'card must be one of %s' % self.cards
+        card = play['card']
+        required = self._get_required_play()
+        if required and card != required['card']:
+            return 'must play COUNTESS'
+        if card in (Cards.GUARD, Cards.PRIEST, Cards.BARON, Cards.PRINCE, Cards.KING):
+            if play.get('target') not in self._targets(card):
+                return 'target must be one of %s' % self._targets(card)
+            if card == Cards.GUARD and play.get('challenge') not in range(Cards.PRIEST, Cards.NUM_CARDS):
+                return 'challenge must be between %i and %i' % (Cards.PRIEST, Cards.NUM_CARDS - 1)
+        return None
+
+    def _default_play(self):
+        ret = self._get_required_play()
+        if ret:
+            return ret
+        card = min(self.cards)
+        ret = {'card': card}
+        if card in (Cards.GUARD, Cards.PRIEST, Cards.BARON, Cards.PRINCE, Cards.KING):
+            ret['target'] = random.choice(self._targets(card))
+            if card == Cards.GUARD:
+                ret['challenge'] = Cards.PRIEST
+        return ret
+
+    async def _read(self, deadline):
+        # None when the client has gone or the move is out of time; a slow
+        # client keeps its seat and is asked again on its next turn
+        loop = asyncio.get_running_loop()
+        while True:
+            timeout = None if deadline is None else max(0, deadline - loop.time())
+            try:
+                line = await asyncio.wait_for(self.reader.readline(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            except ConnectionError:
+                line = b''
+            if not line:
+                self.connected = False
+                return None
+            try:
+                play = json.loads(line)
+            except ValueError:
+                return {}
+            # Late replies to turns that were already played for are skipped
+            if not isinstance(play, dict) or play.get('id', self.turns) == self.turns:
+                return play
+
+    async def get_play_async(self):
+        self.turns += 1
+        deadline = None if self.timeout is None else asyncio.get_running_loop().time() + self.timeout
+        while self.connected:
+            self._send({'type': 'turn', 'id': self.turns, 'cards': self.cards, 'targets': self._targets(Cards.PRINCE)})
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                self.connected = False
+                break
+
+            play = await self._read(deadline)
+            if play is None:
+                break
+            error = self._check(play)
+            if error is None:
+                return dict((key, play[key]) for key in ('card', 'target', 'challenge') if key in play)
+            self._send({'type': 'error', 'message': error})
+
+        return self._default_play()
+
+class Table:
+    def __init__(self, number, lineup, num_games, timeout=None):
+        self.number = number
+        self.lineup = lineup
+        self.num_games = num_games
+        self.timeout = timeout
+        self.clients = {}
+        self.full = asyncio.Event()
+        self.done = asyncio.Event()
+        self.wins = [0 for kind in lineup]
+        if self.free_seats() == 0:
+            self.full.set()
+
+    def free_seats(self):
+        return len([i for (i, kind) in enumerate(self.lineup) if kind == 'remote' and i not in self.clients])
+
+    def join(self, name, reader, writer):
+        seat = [i for (i, kind) in enumerate(self.lineup) if kind == 'remote' and i not in self.clients][0]
+        self.clients[seat] = (name, reader, writer)
+        if self.free_seats() == 0:
+            self.full.set()
+        return seat
+
+    async def run(self):
+        await self.full.wait()
+        names = list(arena.NAMES[:len(self.lineup)])
+        for (seat, (name, reader, writer)) in self.clients.items():
+            names[seat] = name
+
+        agents = []
+        for (i, kind) in enumerate(self.lineup):
+            if kind == 'remote':
+                (name, reader, writer) = self.clients[i]
+                agents.append(RemoteAgent(i, names, reader, writer, self.timeout))
+                send(writer, {'type': 'seated', 'table': self.number, 'player': i, 'names': names})
+            else:
+                agents.append(arena.AGENT_TYPES[kind](i, names))
+
+        dealer = AsyncDealer(agents, [i for (i, kind) in enumerate(self.lineup) if kind in OFFLOAD_TYPES])
+        try:
+            for game in range(self.num_games):
+                winner = await dealer.do_game()
+                self.wins[winner] += 1
+        finally:
+            for (name, reader, writer) in self.clients.values():
+                if not writer.is_closing():
+                    send(writer, {'type': 'bye', 'wins': self.wins})
+                    writer.close()
+            self.done.set()
+
+        return self.wins
+
+class Server:
+    def __init__(self, lineup, num_tables, num_games, timeout=None):
+        self.tables = [Table(i, lineup, num_games, timeout) for i in range(num_tables)]
+
+    async def handle(self, reader, writer):
+        try:
+            message = json.loads(await reader.readline())
+        except ValueError:
+            message = None
+        if not isinstance(message, dict) or message.get('type') != 'join':
+            send(writer, {'type': 'error', 'message': 'expected join'})
+            writer.close()
+            return
+
+        tables = [table for table in self.tables if table.free_seats()]
+        if not tables:
+            send(writer, {'type': 'error', 'message': 'no free seats'})
+            writer.close()
+            return
+
+        table = tables[0]
+        seat = table.join(str(message.get('name', 'Player')), reader, writer)
+        send(writer, {'type': 'welcome', 'table': table.number, 'player': seat})
+        # The table owns the connection from here on
+        await table.done.wait()
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        if ready is not None:
+            ready.set_result(server.sockets[0].getsockname()[1])
+        async with server:
+            results = await asyncio.gather(*[table.run() for table in self.tables])
+        return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=4004, help='port to listen on')
+    parser.add_argument('--tables', type=int, default=1, help='number of concurrent tables')
+    parser.add_argument('--games', type=int, default=1, help='games per table')
+    parser.add_argument('--lineup', default='remote,lowball,lowball,endgame', help='comma-separated seats; remote seats wait for clients')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds a client may take per move before it is played for')
+    parser.add_argument('--seed', type=int, default=None, help='seed for bot and dealer randomness')
+    parser.add_argument('--variant', choices=sorted(VARIANTS), default='classic', help='deck and table variant')
+    args = parser.parse_args()
+    use_variant(args.variant)
+
+    try:
+        lineup = arena.parse_lineup(args.lineup, ('remote',))
+    except ValueError as e:
+        parser.error(str(e))
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    server = Server(lineup, args.tables, args.games, args.timeout)
+    print('Listening on %s:%i' % (args.host, args.port))
+    results = asyncio.run(server.serve(args.host, args.port))
+    for (table, wins) in zip(server.tables, results):
+        print('Table %i: %s' % (table.number, '  '.join('%s %i' % (kind, count) for (kind, count) in zip(table.lineup, wins))))
@@ -0,0 +1,142 @@
+from card import Cards
+
+TARGETED = (Cards.GUARD, Cards.PRIEST, Cards.BARON, Cards.PRINCE, Cards.KING)
+
+class GameState:
+    # Agent-free round position for search. Each player holds one card (0
+    # once out) and the player to move also holds the card just drawn. The
+    # deck is never modified; drawing moves the top index down, so every step
+    # can be undone from a single trail entry.
+    __slots__ = ('hand', 'drawn', 'deck', 'top', 'protected', 'current', 'alive', 'winner', 'done', 'trail')
+
+    def __init__(self, hand, deck, current, drawn, protected=0):
+        self.hand = hand
+        self.deck = deck
+        self.top = len(deck)
+        self.current = current
+        self.drawn = drawn
+        self.protected = protected
+        self.alive = len([card for card in hand if card])
+        self.winner = None
+        self.done = False
+        self.trail = []
+
+    @staticmethod
+    def from_dealer(dealer, current):
+        # Position of a dealer whose current player has just drawn
+        infos = dealer.agent_info
+        hand = [0 if info.out else info.cards[0] for info in infos]
+        protected = 0
+        for (i, info) in enumerate(infos):
+            if info.handmaiden:
+                protected |= 1 << i
+        return GameState(hand, list(dealer.deck.cards), current, infos[current].cards[1], protected)
+
+    def copy(self):
+        state = GameState(list(self.hand), self.deck, self.current, self.drawn, self.protected)
+        state.top = self.top
+        state.winner = self.winner
+        state.done = self.done
+        return state
+
+    def remaining(self):
+        return self.top
+
+    def cards(self, player):
+        if player == self.current and self.drawn:
+            return (self.hand[player], self.drawn)
+        return (self.hand[player],)
+
+    def targets(self, card):
+        player = self.current
+        return [i for (i, held) in enumerate(self.hand) if held and (i != player or card == Cards.PRINCE)]
+
+    def legal_plays(self):
+        held = self.hand[self.current]
+        drawn = self.drawn
+        if Cards.COUNTESS in (held, drawn) and (Cards.PRINCE in (held, drawn) or Cards.KING in (held, drawn)):
+            return [(Cards.COUNTESS, None, None)]
+
+        plays = []
+        for card in ((held,) if held == drawn else (held, drawn)):
+            if card not in TARGETED:
+                plays.append((card, None, None))
+                continue
+            for target in self.targets(card):
+                if card == Cards.GUARD:
+                    for challenge in range(Cards.PRIEST, Cards.NUM_CARDS):
+                        plays.append((card, target, challenge))
+                else:
+                    plays.append((card, target, None))
+        return plays
+
+    def snapshot(self):
+        return len(self.trail)
+
+    def undo(self, mark):
+        hand = self.hand
+        trail = self.trail
+        while len(trail) > mark:
+            (player, held, target, target_card, self.drawn, self.top, self.protected, self.current, self.alive, self.winner, self.done) = trail.pop()
+            if target is not None:
+                hand[target] = target_card
+            hand[player] = held
+
+    def step(self, card, target=None, challenge=None):
+        # Same rules as Dealer._apply_play, applied to the player to move
+        hand = self.hand
+        player = self.current
+        held = hand[player]
+        self.trail.append((player, held, target, None if target is None else hand[target], self.drawn, self.top,
+            self.protected, player, self.alive, self.winner, self.done))
+
+        hand[player] = self.drawn if card == held else held
+        self.drawn = 0
+        self.protected &= ~(1 << player)
+
+        if target is not None and not (self.protected >> target) & 1:
+            if card == Cards.GUARD:
+                if hand[target] == challenge:
+                    hand[target] = 0
+                    self.alive -= 1
+            elif card == Cards.BARON:
+                if hand[target] > hand[player]:
+                    hand[player] = 0
+                    self.alive -= 1
+                elif hand[target] < hand[player]:
+                    hand[target] = 0
+                    self.alive -= 1
+            elif card == Cards.PRINCE:
+                if hand[target] == Cards.PRINCESS:
+                    hand[target] = 0
+                    self.alive -= 1
+                else:
+                    self.top -= 1
+                    hand[target] = self.deck[self.top]
+            elif card == Cards.KING:
+                hand[player], hand[target] = hand[target], hand[player]
+
+        if card == Cards.HANDMAIDEN:
+            self.protected |= 1 << player
+        elif card == Cards.PRINCESS:
+            hand[player] = 0
+            self.alive -= 1
+
+        self._advance()
+
+    def _advance(self):
+        if self.alive > 1:
+            hand = self.hand
+            current = (self.current + 1) % len(hand)
+            while not hand[current]:
+                current = (current + 1) % len(hand)
+            if self.top > 1:
+                self.current = current
+                self.top -= 1
+                self.drawn = self.deck[self.top]
+                return
+
+        self.done = True
+        best = max(self.hand)
+        if self.hand.count(best) == 1:
+            self.winner = self.hand.index(best)
@@ -0,0 +1,162 @@
+import argparse, itertools, math, multiprocessing, random, statistics
+
+import arena
+from card import Cards
+
+# Heuristic agents only; the search, solver and book agents cost far more per
+# game, so they are compared on request
+DEFAULT_AGENTS = ('random', 'lowball', 'endgame')
+
+def seatings(first, second, num_seats):
+    ret = []
+    for count in range(1, num_seats):
+        kinds = [first] * count + [second] * (num_seats - count)
+        ret.extend(sorted(set(itertools.permutations(kinds))))
+    return ret
+
+def _play_batch(args):
+    (seed, first, lineups) = args
+    total = 0.0
+    squares = 0.0
+    wins = 0
+    # One table per seating, reused for every game it is dealt
+    tables = {}
+    try:
+        for (i, lineup) in enumerate(lineups):
+            games = tables.get(lineup)
+            if games is None:
+                games = tables[lineup] = arena.Arena(arena.make_agents(lineup))
+            random.seed('%s:%i' % (seed, i))
+            winner = games.dealer.do_game()
+            share = lineup.count(first) / len(lineup)
+            won = lineup[winner] == first
+            wins += won
+            total += won - share
+            squares += (won - share) ** 2
+    finally:
+        for games in tables.values():
+            for agent in games.agents:
+                if hasattr(agent, 'close'):
+                    agent.close()
+    return (len(lineups), wins, total, squares)
+
+class Pairing:
+    def __init__(self, first, second, num_seats):
+        self.first = first
+        self.second = second
+        self.seatings = seatings(first, second, num_seats)
+        self.games = 0
+        self.wins = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.looks = 0
+        self.radius = float('inf')
+        self.result = None
+
+    def __str__(self):
+        return '%s vs %s' % (self.first, self.second)
+
+    def batch(self, seed, num_games):
+        # Cycle through every seat permutation and opponent mix in order so
+        # each batch stays balanced across seatings
+        lineups = [self.seatings[(self.games + i) % len(self.seatings)] for i in range(num_games)]
+        return ('%s:%s:%s:%i' % (seed, self.first, self.second, self.looks), self.first, lineups)
+
+    def mean(self):
+        return self.total / self.games if self.games else 0.0
+
+    def update(self, games, wins, total, squares, alpha):
+        self.games += games
+        self.wins += wins
+        self.total += total
+        self.squares += squares
+        self.looks += 1
+
+        # Normal interval on the excess win rate, with the error budget split
+        # over looks so that testing after every batch keeps level alpha
+        look_alpha = alpha / (self.looks * (self.looks + 1))
+        mean = self.mean()
+        variance = max(self.squares / self.games - mean * mean, 1e-9)
+        z = statistics.NormalDist().inv_cdf(1 - look_alpha / 2)
+        self.radius = z * math.sqrt(variance / self.games)
+        if mean > self.radius:
+            self.result = self.first
+        elif mean < -self.radius:
+            self.result = self.second
+
+class Tournament:
+    def __init__(self, kinds, num_seats=4, alpha=0.05, batch_games=200, max_games=20000, seed=0, workers=None):
+        self.pairings = [Pairing(first, second, num_seats) for (first, second) in itertools.combinations(kinds, 2)]
+        self.alpha = alpha / len(self.pairings)
+        self.batch_games = batch_games
+        self.max_games = max_games
+        self.seed = seed
+        self.workers = workers or multiprocessing.cpu_count()
+
+    def _open(self):
+        return [pairing for pairing in self.pairings if pairing.result is None and pairing.games < self.max_games]
+
+    def run(self, report=None):
+        pool = multiprocessing.Pool(self.workers) if self.workers > 1 else None
+        try:
+            while True:
+                pairings = self._open()
+                if not pairings:
+                    break
+
+                # Resolved pairings drop out, so each wave spends the whole
+                # pool on the pairings that are still undecided
+                per_pairing = max(self.batch_games, self.batch_games * self.workers // len(pairings))
+                jobs = []
+                for pairing in pairings:
+                    num_games = min(per_pairing, self.max_games - pairing.games)
+                    jobs.append(pairing.batch(self.seed, num_games))
+
+                results = pool.map(_play_batch, jobs) if pool else list(map(_play_batch, jobs))
+                for (pairing, (games, wins, total, squares)) in zip(pairings, results):
+                    pairing.update(games, wins, total, squares, self.alpha)
+                    if report:
+                        report(pairing)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        return self.pairings
+
+    def games(self):
+        return sum(pairing.games for pairing in self.pairings)
+
+def _print_pairing(pairing):
+    state = 'undecided' if pairing.result is None else '%s stronger' % pairing.result
+    print('%-20s games %6i  excess win rate %+.3f +/- %.3f  %s' % (pairing, pairing.games, pairing.mean(), pairing.radius, state))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agents', default=','.join(DEFAULT_AGENTS), help='comma-separated agent types to compare, of %s (default: %s)' % (', '.join(sorted(arena.AGENT_TYPES)), ','.join(DEFAULT_AGENTS)))
+    parser.add_argument('--seats', type=int, default=4, help='players per table')
+    parser.add_argument('--alpha', type=float, default=0.05, help='family-wise significance level')
+    parser.add_argument('--batch', type=int, default=200, help='games per pairing between looks')
+    parser.add_argument('--max-games', type=int, default=20000, help='game cap per pairing')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=0, help='master seed')
+    parser.add_argument('--verbose', action='store_true', help='print every look')
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.agents.split(',')]
+    for kind in kinds:
+        if kind not in arena.AGENT_TYPES:
+            parser.error('Unknown agent type %s' % kind)
+    if len(kinds) < 2:
+        parser.error('Need at least two agent types')
+    variant = Cards.variant
+    if args.seats not in range(max(2, variant.min_players), min(len(arena.NAMES), variant.max_players) + 1):
+        parser.error('--seats must be between %i and %i' % (max(2, variant.min_players), min(len(arena.NAMES), variant.max_players)))
+
+    tournament = Tournament(kinds, args.seats, args.alpha, args.batch, args.max_games, args.seed, args.workers)
+    tournament.run(_print_pairing if args.verbose else None)
+    print('Final results:')
+    for pairing in tournament.pairings:
+        _print_pairing(pairing)
+    fixed = len(tournament.pairings) * args.max_games
+    print('Simulated %i games (%.1fx fewer than %i fixed-length runs)' % (tournament.games(), fixed / max(1, tournament.games()), fixed))
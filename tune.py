@@ -0,0 +1,135 @@
+import argparse, itertools, json, multiprocessing, random
+
+import arena
+from agent import LowballAgent, EndgameAgent
+
+AGENTS = {
+    'lowball': LowballAgent,
+    'endgame': EndgameAgent
+    }
+
+SPACE = {
+    'guard_certainty': [0.0, 0.25, 0.5, 0.75, 1.0],
+    'baron_certainty': [0.0, 0.25, 0.5, 0.75, 1.0],
+    'priest_handmaiden': [True, False],
+    'target_order': ['certainty', 'score'],
+    'discard': ['lowest', 'highest'],
+    'exact_beliefs': [False, True],
+    'endgame_margin': [-1, 0, 1, 2, 3]
+    }
+
+def candidates(kind, count, rng):
+    # The default configuration plus distinct random points of the grid
+    agent_class = AGENTS[kind]
+    names = [name for name in SPACE if name in agent_class.PARAMS]
+    grid = list(itertools.product(*[SPACE[name] for name in names]))
+    rng.shuffle(grid)
+
+    default = dict(agent_class.PARAMS)
+    ret = [default]
+    for values in grid:
+        if len(ret) >= count:
+            break
+        params = dict(default, **dict(zip(names, values)))
+        if params != default:
+            ret.append(params)
+    return ret
+
+def _play(args):
+    # The candidate takes every seat in turn against the same game seeds, so
+    # all candidates are compared on identical deals
+    (index, kind, params, opponents, seed, first_game, num_games) = args
+    num_players = len(opponents) + 1
+    names = arena.NAMES[:num_players]
+    wins = 0
+    for seat in range(num_players):
+        others = iter(opponents)
+        agents = [AGENTS[kind](i, names, params) if i == seat else arena.AGENT_TYPES[next(others)](i, names)
+            for i in range(num_players)]
+        wins += arena.Arena(agents, seed).run_games(num_games, first_game)[seat]
+    return (index, wins)
+
+class Tuner:
+    # Successive halving: every surviving candidate plays up to the current
+    # budget, the best 1/eta survive, and the budget grows by eta, so weak
+    # configurations are dropped after a few hundred games
+    def __init__(self, kind, opponents, seed, workers=None, chunk_size=25):
+        self.kind = kind
+        self.opponents = opponents
+        self.seed = seed
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunk_size = chunk_size
+
+    def _jobs(self, configs, alive, played, budget):
+        for i in alive:
+            for first_game in range(played[i], budget, self.chunk_size):
+                yield (i, self.kind, configs[i], self.opponents, self.seed, first_game, min(self.chunk_size, budget - first_game))
+
+    def run(self, configs, games, eta=2, report=None):
+        seats = len(self.opponents) + 1
+        wins = [0 for params in configs]
+        played = [0 for params in configs]
+        alive = list(range(len(configs)))
+        budget = games
+        rung = 0
+
+        pool = multiprocessing.Pool(self.workers) if self.workers > 1 else None
+        try:
+            while True:
+                jobs = self._jobs(configs, alive, played, budget)
+                results = pool.imap_unordered(_play, jobs) if pool else map(_play, jobs)
+                for (i, count) in results:
+                    wins[i] += count
+                for i in alive:
+                    played[i] = budget
+
+                alive.sort(key=lambda i: wins[i], reverse=True)
+                rates = [(i, wins[i] / (budget * seats)) for i in alive]
+                if report:
+                    report(rung, budget * seats, rates, configs)
+                if len(alive) == 1:
+                    break
+                alive = alive[:max(1, len(alive) // eta)]
+                budget *= eta
+                rung += 1
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        best = alive[0]
+        return (configs[best], wins[best] / (played[best] * seats))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--agent', choices=sorted(AGENTS), default='endgame', help='agent type to tune')
+    parser.add_argument('--opponents', default='lowball,lowball,lowball', help='comma-separated opponent agent types')
+    parser.add_argument('--candidates', type=int, default=32, help='number of configurations to start with')
+    parser.add_argument('--games', type=int, default=100, help='games per seat for each candidate in the first rung')
+    parser.add_argument('--eta', type=int, default=2, help='keep 1/ETA of the candidates per rung and multiply the budget by ETA')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all CPUs)')
+    parser.add_argument('--seed', type=int, default=0, help='master seed for candidate sampling and games')
+    parser.add_argument('--output', metavar='PATH', help='write the best configuration as JSON to PATH')
+    args = parser.parse_args()
+
+    try:
+        opponents = arena.parse_lineup('%s,%s' % (args.agent, args.opponents))[1:]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.eta < 2:
+        parser.error('--eta must be at least 2')
+
+    configs = candidates(args.agent, args.candidates, random.Random(args.seed))
+
+    def report(rung, games, rates, configs):
+        print('Rung %i: %i candidates, %i games each' % (rung, len(rates), games))
+        for (i, rate) in rates[:5]:
+            print('  %5.1f%%  #%-3i %s%s' % (rate * 100, i, json.dumps(configs[i], sort_keys=True), '  (default)' if i == 0 else ''))
+
+    tuner = Tuner(args.agent, opponents, args.seed, args.workers)
+    (params, rate) = tuner.run(configs, args.games, args.eta, report)
+    print('Best %s configuration (%.1f%% wins): %s' % (args.agent, rate * 100, json.dumps(params, sort_keys=True)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'agent': args.agent, 'params': params, 'win_rate': rate}, f, indent=2, sort_keys=True)
+            f.write('\n')